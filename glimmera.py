@@ -40,14 +40,33 @@ also pyOpenGL
 
 import pygame
 from pygame.locals import *
-from OpenGL.GL import *
-from OpenGL.GLU import *
-from OpenGL.GLUT import *
+# the software renderer and the batch tools work without a GL library,
+# only drawing with OpenGL needs one
+try :
+    from OpenGL.GL import *
+    from OpenGL.GLU import *
+    openGLError = None
+except ( ImportError, AttributeError, OSError ) as e :
+    openGLError = e
 import random
 import math
 import os
+import sys
 import colorsys
 import time
+import json
+import functools
+import collections
+import bisect
+import hashlib
+import tempfile
+import ctypes
+import struct
+import zlib
+import threading
+import queue
+import concurrent.futures
+import numpy as np
 
 # CONSTANTS
 
@@ -63,6 +82,85 @@ fileFormat = "PNG"
 renderFiles = 'renderframes'
 animName = 'glimmera'
 
+# the animation parameters the main loop starts with, and that offline renders
+# read from parameter files
+defaultParameters = {
+    'shutter_samples' : 260,
+    'shutter_length' : 8.0,
+    'shutter_fade_width' : 0.5,
+    'exposure' : 1.5,
+    'offset' : [ -0.57, 1.08 ],
+    'offset_wave_amps' : [ 0.4, 0.6 ],
+    'offset_wave_freqs' : [ 0.027, 0.013 ],
+    'freq' : 0.115,
+    'hue_freq' : 0.4,
+    'offset_freq' : 0.00633,
+    'scale_freq' : 114.0,
+    'rot_freq' : 2.536,
+    # how float frames are brought into 0..1, one of toneMaps
+    'tone_map' : 'linear',
+}
+
+# decoded textures are kept here as memory mapped .npy files, None disables it
+textureCacheDir = os.path.join( os.environ.get( 'XDG_CACHE_HOME', os.path.join( os.path.expanduser( '~' ), '.cache' ) ),
+                                'glimmera', 'textures' )
+# the least recently used decoded textures are deleted past this many bytes
+textureCacheBytes = 2 * 1024 * 1024 * 1024
+
+# offline renders keep their frames here, see FrameCache, in at most
+# frameCacheBytes; bump frameCacheVersion when a change alters rendered frames
+frameCacheDir = os.path.join( os.path.dirname( textureCacheDir ), 'frames' )
+frameCacheBytes = 4 * 1024 * 1024 * 1024
+frameCacheVersion = 1
+
+# GL texture memory the TextureManager keeps resident, in bytes, and how many
+# textures either side of the selected one it loads ahead
+textureMemoryBudget = 512 * 1024 * 1024
+texturePrefetch = 1
+
+# threads decoding textures in the background: the selected texture's
+# neighbours first, then every other texture into textureCacheDir, so later
+# selections and the next start load from the cache
+textureDecodeWorkers = min( 4, os.cpu_count() or 1 )
+
+# adaptive sampling (A key) aims for this frame rate while input is active
+adaptiveTargetFps = 30.0
+
+# P toggles the interaction proxy: while there is input, frames are drawn at
+# 1 / proxyScale of the window size with 1 / proxySampleDivisor of the shutter
+# samples and scaled up, until input has been idle for proxyIdleDelay seconds
+proxyScale = 4
+proxySampleDivisor = 4
+proxyIdleDelay = 0.3
+
+# accumulation mode (T key) splits each shutter into this many cached segments:
+# more follow the shutter profile more closely, but each one held costs two
+# frame sized images
+subframeSegments = 16
+
+# where recorded frames go: one of frameSinks, and its output file (None for
+# the default, '-' streams raw and y4m frames to stdout)
+recordSink = 'png'
+recordOutput = None
+
+# C toggles a contact sheet of every texture, each cell drawn from one atlas
+# texture of atlasCellSize square cells, with atlasGutter edge texels around
+# each so mip levels up to log2( atlasGutter ) do not bleed between cells
+atlasCellSize = 128
+atlasGutter = 8
+
+# L toggles logging every parameter change here, for glimmera_render.py --timeline
+timelineFile = '%s/%s_timeline.jsonl' % ( renderFiles, animName )
+
+# camera setup shared by resizeGL, drawPoly and the software renderer
+fieldOfView = 45.0
+polyDepth = 6.0
+
+# vertex buffer for the batched quads, created by initGL for each GL context
+quadVertexBuffer = None
+# the GLSL program of drawFrameShader, compiled on first use
+shutterShaderProgram = None
+
 # FUNCTIONS
 # hermite smoothstep
 
@@ -103,21 +201,137 @@ def getFloatAsStarsStr( float_value, star_white_point, num_stars_at_white_point
     star = "*" * numStars
     return star
 
-def loadTextureGL( texture_files ) :
-    gl_textures = glGenTextures( len( texture_files ) )
+def getTextureCacheFilename( texture_file ) :
+    """
+    Returns the texture cache file for texture_file, keyed by its path,
+    modification time and size so an edited texture is decoded again.
+    """
+    fileStat = os.stat( texture_file )
+    key = "%s:%d:%d" % ( os.path.abspath( texture_file ), fileStat.st_mtime_ns, fileStat.st_size )
+    return os.path.join( textureCacheDir, hashlib.sha1( key.encode( "utf-8" ) ).hexdigest() + ".npy" )
+
+def decodeTexture( texture_file ) :
+    textureSurface = pygame.image.load( texture_file )
+    textureData = pygame.image.tostring( textureSurface, "RGBX", 1 )
+    return np.frombuffer( textureData, dtype=np.uint8 ).reshape(
+        textureSurface.get_height(), textureSurface.get_width(), 4 )
+
+def loadTextureData( texture_file ) :
+    """
+    Returns the texture as a ( height, width, 4 ) uint8 RGBX array, bottom row
+    first as glTexImage2D wants it. Decoded textures are cached in
+    textureCacheDir and memory mapped from there on later loads, so the image
+    file is only decoded again when it changes. The least recently loaded
+    ones are deleted when the cache grows past textureCacheBytes.
+    """
+    if textureCacheDir is None :
+        return decodeTexture( texture_file )
+    
+    cacheFilename = getTextureCacheFilename( texture_file )
+    try :
+        textureData = np.load( cacheFilename, mmap_mode='r' )
+    except ( IOError, ValueError ) :
+        pass
+    else :
+        try :
+            # mark it used, so it is the last to be pruned
+            os.utime( cacheFilename )
+        except OSError :
+            pass
+        return textureData
+    
+    textureData = decodeTexture( texture_file )
+    tempFilename = None
+    try :
+        if not os.path.isdir( textureCacheDir ) :
+            os.makedirs( textureCacheDir )
+        # write then rename, so other processes never map a partial file
+        tempHandle, tempFilename = tempfile.mkstemp( dir=textureCacheDir, suffix=".tmp" )
+        with os.fdopen( tempHandle, 'wb' ) as tempFile :
+            np.save( tempFile, textureData )
+        os.replace( tempFilename, cacheFilename )
+    except OSError as e :
+        print( "Could not cache texture %s: %s" % ( texture_file, e ) )
+        if tempFilename is not None :
+            try :
+                os.remove( tempFilename )
+            except OSError :
+                pass
+        return textureData
+    try :
+        evictLeastRecentlyUsed( textureCacheDir, textureCacheBytes )
+    except OSError as e :
+        print( "Could not prune the texture cache: %s" % e )
+    return textureData
+
+def evictLeastRecentlyUsed( directory, target_bytes ) :
+    """
+    Deletes the least recently used (oldest modified) .npy files in directory
+    until they take at most target_bytes. Returns the bytes left and the
+    number of files deleted.
+    """
+    entries = []
+    for entry in os.scandir( directory ) :
+        if entry.name.endswith( '.npy' ) :
+            try :
+                entryStat = entry.stat()
+            except OSError :
+                # deleted by another process since the scan
+                continue
+            entries.append( ( entryStat.st_mtime, entryStat.st_size, entry.path ) )
+    entries.sort()
+    totalBytes = sum( entrySize for entryTime, entrySize, entryPath in entries )
+    evicted = 0
+    for entryTime, entrySize, entryPath in entries :
+        if totalBytes <= target_bytes :
+            break
+        try :
+            os.remove( entryPath )
+        except OSError :
+            continue
+        totalBytes -= entrySize
+        evicted += 1
+    return totalBytes, evicted
+
+def warmTextureCache( texture_file ) :
+    """
+    Decodes texture_file into textureCacheDir unless it is there already.
+    """
+    try :
+        loadTextureData( texture_file )
+    except ( pygame.error, OSError ) as e :
+        print( "Could not load texture %s: %s" % ( texture_file, e ) )
+
+def uploadTexture( gl_texture, texture_data, mipmaps=False ) :
+    glBindTexture( GL_TEXTURE_2D, gl_texture )
+    if mipmaps and not bool( glGenerateMipmap ) :
+        glTexParameteri( GL_TEXTURE_2D, GL_GENERATE_MIPMAP, GL_TRUE )
+    glTexImage2D( GL_TEXTURE_2D, 0, GL_RGBA, texture_data.shape[1],
+                  texture_data.shape[0], 0, GL_RGBA, GL_UNSIGNED_BYTE, np.ascontiguousarray( texture_data ) )
+    glTexParameterf( GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR )
+    if mipmaps :
+        if bool( glGenerateMipmap ) :
+            glGenerateMipmap( GL_TEXTURE_2D )
+        glTexParameterf( GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR_MIPMAP_LINEAR )
+    else :
+        glTexParameterf( GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR )
+
+def loadTextureGL( texture_files, mipmaps=False ) :
+    gl_textures = np.atleast_1d( glGenTextures( len( texture_files ) ) )
     textureID = 0
     
     for textureFile in texture_files:
-        textureSurface = pygame.image.load( textureFile )
-        textureData = pygame.image.tostring( textureSurface, "RGBX", 1 )
-        glBindTexture( GL_TEXTURE_2D, gl_textures[ textureID ] )
-        glTexImage2D( GL_TEXTURE_2D, 0, GL_RGBA, textureSurface.get_width(),
-                      textureSurface.get_height(), 0, GL_RGBA, GL_UNSIGNED_BYTE, textureData )
-        glTexParameterf( GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR )
-        glTexParameterf( GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR )
+        uploadTexture( gl_textures[ textureID ], loadTextureData( textureFile ), mipmaps )
         textureID += 1
     return gl_textures
 
+def texturesResident( gl_textures ) :
+    """
+    True when the GL textures still exist, e.g. when set_mode kept the
+    context over a fullscreen toggle, so they need not be uploaded again.
+    """
+    return all( glIsTexture( texture ) for texture in gl_textures )
+
 def getShutter( pos, fade_width, minimum ) :
     shUp = smoothstep( pos, 0, fade_width )
     shDown = 1.0 - smoothstep( pos, 1.0 - fade_width, 1.0 )
@@ -126,12 +340,8 @@ def getShutter( pos, fade_width, minimum ) :
     return ( shUp * shDown * (1.0 - minimum) ) + minimum
 
 def getShutterSum( shutter_steps, shutter_fade_width ) :
-    shutter_sum = 0
-    for i in range( shutter_steps ) :
-        shutterPos = float( i ) / max( 1.0, float( shutter_steps - 1 ) )
-        sh = getShutter( shutterPos, shutter_fade_width, 0.001 )
-        shutter_sum += sh
-    return shutter_sum
+    positions, weights = getShutterTable( shutter_steps, shutter_fade_width )
+    return float( weights.sum() )
 
 def getOffsetWave( frame_number, shutter_offset, offset_wave_amps, offset_wave_freqs ) :
     xsine = math.sin( (frame_number + shutter_offset) * offset_wave_freqs[ 0 ] ) * offset_wave_amps[ 0 ]
@@ -139,28 +349,394 @@ def getOffsetWave( frame_number, shutter_offset, offset_wave_amps, offset_wave_f
     return [ xsine, ysine ]
 
 
+#######################
+# PARAMETERS AND TIMELINES
+#######################
+
+# The main loop keeps its live state in a Parameters object, and can log it to
+# a timeline file with a TimelineWriter: one JSON object a line, the whole
+# state on the first frame and then what changed on each frame it changed.
+# glimmera_render.py --timeline reads one back with Timeline and renders it
+# offline at full sample count and any size.
+
+class Parameters( object ) :
+    """
+    defaultParameters as attributes, plus the selected texture's index.
+    """
+    __slots__ = tuple( sorted( defaultParameters ) ) + ( 'texture', )
+    
+    def __init__( self, values=None ) :
+        self.texture = 0
+        self.update( defaultParameters )
+        if values :
+            self.update( values )
+    
+    def update( self, values ) :
+        for name, value in values.items() :
+            if name not in self.__slots__ :
+                raise ValueError( "unknown parameter %r" % name )
+            # lists are copied, so changing them in place does not change values
+            setattr( self, name, list( value ) if isinstance( value, ( list, tuple ) ) else value )
+    
+    def toDict( self ) :
+        values = {}
+        for name in self.__slots__ :
+            value = getattr( self, name )
+            values[ name ] = list( value ) if isinstance( value, list ) else value
+        return values
+
+class TimelineWriter( object ) :
+    """
+    Logs Parameters to a timeline file, frame by frame. texture_files are the
+    files the texture indices select.
+    """
+    def __init__( self, filename, texture_files, frame_width=width, frame_height=height ) :
+        directory = os.path.dirname( filename )
+        if directory and not os.path.isdir( directory ) :
+            os.makedirs( directory )
+        self.timeline_file = open( filename, 'w' )
+        self.texture_files = [ os.path.abspath( f ) for f in texture_files ]
+        self.frame_size = [ frame_width, frame_height ]
+        self.last_values = None
+        self.last_frame = None
+    
+    def write( self, entry ) :
+        # flushed as it goes, so a crashed session still leaves its timeline
+        self.timeline_file.write( json.dumps( entry, sort_keys=True ) + "\n" )
+        self.timeline_file.flush()
+    
+    def log( self, frame_number, parameters ) :
+        """
+        Logs the parameters frame_number is drawn with, if they changed.
+        """
+        values = parameters.toDict()
+        if self.last_values is None :
+            self.write( { 'frame' : frame_number, 'parameters' : values,
+                          'textures' : self.texture_files, 'size' : self.frame_size } )
+        else :
+            changes = dict( ( name, value ) for name, value in values.items()
+                            if value != self.last_values[ name ] )
+            if changes :
+                self.write( { 'frame' : frame_number, 'parameters' : changes } )
+        self.last_values = values
+        self.last_frame = frame_number
+    
+    def close( self ) :
+        if self.last_frame is not None :
+            self.write( { 'frame' : self.last_frame + 1, 'end' : True } )
+        self.timeline_file.close()
+
+class Timeline( object ) :
+    """
+    A timeline file read back. Frames first_frame up to end_frame were logged,
+    getParameters gives the parameter dict of any of them.
+    """
+    def __init__( self, filename ) :
+        self.change_frames = []
+        self.states = []
+        self.texture_files = []
+        self.frame_size = [ width, height ]
+        self.end_frame = None
+        with open( filename ) as timelineFile :
+            for line in timelineFile :
+                entry = json.loads( line )
+                if entry.get( 'end' ) :
+                    self.end_frame = entry[ 'frame' ]
+                    continue
+                if self.states :
+                    state = dict( self.states[ -1 ] )
+                else :
+                    state = Parameters().toDict()
+                    self.texture_files = entry.get( 'textures', [] )
+                    self.frame_size = entry.get( 'size', self.frame_size )
+                state.update( entry[ 'parameters' ] )
+                self.change_frames.append( entry[ 'frame' ] )
+                self.states.append( state )
+        if not self.states :
+            raise ValueError( "%s has no frames" % filename )
+        self.first_frame = self.change_frames[ 0 ]
+        if self.end_frame is None :
+            self.end_frame = self.change_frames[ -1 ] + 1
+    
+    def getFrames( self ) :
+        return range( self.first_frame, self.end_frame )
+    
+    def getParameters( self, frame_number ) :
+        index = max( 0, bisect.bisect_right( self.change_frames, frame_number ) - 1 )
+        return dict( self.states[ index ] )
+    
+    def getTextureFile( self, parameters ) :
+        return self.texture_files[ parameters[ 'texture' ] % len( self.texture_files ) ]
+
+#######################
+# TEXTURE RESIDENCY
+#######################
+
+class TextureManager( object ) :
+    """
+    Keeps GL textures for a list of texture files resident on demand.
+    
+    get( index ) uploads the texture the first time it is selected, with mip
+    maps so shrinking quads stay smooth. The neighbours within prefetch of it
+    are decoded on a pool of background threads and uploaded once ready, and
+    after the first get the rest are decoded into the texture cache by one
+    more thread of their own, so they never hold up a prefetch. Resident
+    textures are kept within memory_budget bytes by deleting the least
+    recently used ones, but never the one just selected.
+    """
+    
+    def __init__( self, texture_files, memory_budget=textureMemoryBudget,
+                  prefetch=texturePrefetch, mipmaps=True, workers=textureDecodeWorkers ) :
+        self.texture_files = list( texture_files )
+        self.memory_budget = memory_budget
+        self.prefetch = prefetch
+        self.mipmaps = mipmaps
+        # index -> ( gl texture, bytes ), least recently used first
+        self.resident = collections.OrderedDict()
+        self.resident_bytes = 0
+        # index -> future of loadTextureData
+        self.loading = {}
+        # indices whose prefetch failed, so they are not decoded every frame
+        self.failed = set()
+        self.executor = concurrent.futures.ThreadPoolExecutor( max_workers=workers )
+        # the cache is warmed apart from the prefetches, one texture at a time
+        self.warm_executor = concurrent.futures.ThreadPoolExecutor( max_workers=1 )
+        self.warming = None
+        self.warm_remaining = 0
+        self.closed = threading.Event()
+        self.uploads = 0
+        self.evictions = 0
+    
+    def __len__( self ) :
+        return len( self.texture_files )
+    
+    def get( self, index ) :
+        """
+        Returns the GL texture for texture_files[ index ], loading it if needed.
+        """
+        index %= len( self.texture_files )
+        if index in self.resident :
+            self.resident.move_to_end( index )
+        else :
+            future = self.loading.pop( index, None )
+            if future is not None and not future.cancel() :
+                textureData = future.result()
+            else :
+                # not started yet, so waiting would only add the queue ahead of it
+                textureData = loadTextureData( self.texture_files[ index ] )
+            self.upload( index, textureData )
+            self.failed.discard( index )
+        
+        self.prefetchNeighbours( index )
+        self.evict( keep=index )
+        if self.warming is None :
+            self.warmCache()
+        return self.resident[ index ][ 0 ]
+    
+    def prefetchNeighbours( self, index ) :
+        # upload what finished decoding, then queue the rest of the neighbourhood
+        for loadingIndex, future in list( self.loading.items() ) :
+            if future.done() :
+                del self.loading[ loadingIndex ]
+                if future.cancelled() :
+                    continue
+                if future.exception() is None :
+                    self.upload( loadingIndex, future.result() )
+                else :
+                    print( "Could not load texture %s: %s" % ( self.texture_files[ loadingIndex ], future.exception() ) )
+                    self.failed.add( loadingIndex )
+        
+        for step in range( 1, self.prefetch + 1 ) :
+            for neighbour in ( index + step, index - step ) :
+                neighbour %= len( self.texture_files )
+                if neighbour not in self.resident and neighbour not in self.loading and neighbour not in self.failed :
+                    self.loading[ neighbour ] = self.executor.submit(
+                        loadTextureData, self.texture_files[ neighbour ] )
+    
+    def warmCache( self ) :
+        """
+        Starts decoding every texture not yet in textureCacheDir into it, on
+        the warming thread, so the data is not held in memory.
+        """
+        self.warm_remaining = len( self.texture_files )
+        self.warming = self.warm_executor.submit( self.warmTextures )
+    
+    def warmTextures( self ) :
+        # the cache files are looked for here too, as a big library takes a while
+        for textureFile in self.texture_files :
+            if self.closed.is_set() or textureCacheDir is None :
+                return
+            try :
+                cached = os.path.exists( getTextureCacheFilename( textureFile ) )
+            except OSError :
+                cached = False
+            if not cached :
+                warmTextureCache( textureFile )
+            self.warm_remaining -= 1
+    
+    def upload( self, index, texture_data ) :
+        glTexture = glGenTextures( 1 )
+        uploadTexture( glTexture, texture_data, self.mipmaps )
+        textureBytes = texture_data.shape[0] * texture_data.shape[1] * 4
+        if self.mipmaps :
+            textureBytes = textureBytes * 4 // 3
+        self.resident[ index ] = ( glTexture, textureBytes )
+        self.resident_bytes += textureBytes
+        self.uploads += 1
+    
+    def evict( self, keep ) :
+        for index in list( self.resident ) :
+            if self.resident_bytes <= self.memory_budget :
+                break
+            if index != keep :
+                glTexture, textureBytes = self.resident.pop( index )
+                glDeleteTextures( [ glTexture ] )
+                self.resident_bytes -= textureBytes
+                self.evictions += 1
+    
+    def isResident( self ) :
+        """
+        False when the GL context was replaced and the textures went with it.
+        """
+        return texturesResident( [ glTexture for glTexture, textureBytes in self.resident.values() ] )
+    
+    def forget( self ) :
+        """
+        Drops the textures without deleting them, after their context is gone.
+        """
+        self.resident.clear()
+        self.resident_bytes = 0
+    
+    def getStats( self ) :
+        return { 'resident' : len( self.resident ), 'resident_bytes' : self.resident_bytes,
+                 'loading' : len( self.loading ), 'failed' : len( self.failed ), 'uploads' : self.uploads,
+                 'evictions' : self.evictions,
+                 'warming' : self.warm_remaining if self.warming is not None and not self.warming.done() else 0 }
+    
+    def close( self ) :
+        """
+        Stops the background decoding without waiting for queued textures.
+        """
+        self.closed.set()
+        self.executor.shutdown( wait=False, cancel_futures=True )
+        self.warm_executor.shutdown( wait=False, cancel_futures=True )
+
+#######################
+# SHUTTER TABLES
+#######################
+
+# The per-sample maths of drawFrame/drawPoly, done for every shutter sample of a
+# frame at once with numpy instead of one Python call chain per sample.
+
+ShutterSamples = collections.namedtuple( 'ShutterSamples',
+    [ 'weight', 'alpha', 'frame', 'offset', 'zrot', 'hue', 'poly_size' ] )
+
+def smoothstepArray( x, smooth_min, smooth_max ) :
+    """
+    Vectorized smoothstep, for arrays of x.
+    """
+    x = np.asarray( x, dtype=np.float64 )
+    if smooth_max > smooth_min :
+        lx = ( x - smooth_min ) / float( smooth_max - smooth_min )
+    elif smooth_min > smooth_max :
+        lx = ( x - smooth_max ) / float( smooth_min - smooth_max )
+    else :
+        lx = ( x > smooth_min ).astype( np.float64 )
+    
+    hermite = -2 * lx * lx * lx + 3 * lx * lx
+    return np.where( x >= smooth_max, 1.0, np.where( x <= smooth_min, 0.0, hermite ) )
+
+def getShutterWeights( positions, shutter_fade_width ) :
+    """
+    Vectorized getShutter, with its 0.001 minimum, for arrays of positions.
+    """
+    shUp = smoothstepArray( positions, 0, shutter_fade_width )
+    shDown = 1.0 - smoothstepArray( positions, 1.0 - shutter_fade_width, 1.0 )
+    minimum = 0.001
+    return ( shUp * shDown * (1.0 - minimum) ) + minimum
+
+@functools.lru_cache( maxsize=32 )
+def getShutterTable( shutter_steps, shutter_fade_width ) :
+    """
+    Returns the shutter positions (0..1) and getShutter weights of every
+    sample, cached per ( shutter_steps, shutter_fade_width ).
+    The arrays are shared between callers, so they are read only.
+    """
+    positions = np.arange( shutter_steps, dtype=np.float64 ) / max( 1.0, float( shutter_steps - 1 ) )
+    weights = getShutterWeights( positions, shutter_fade_width )
+    positions.flags.writeable = False
+    weights.flags.writeable = False
+    return positions, weights
+
+def hueToRgb( hue ) :
+    """
+    Vectorized colorsys.hsv_to_rgb( hue, 1.0, 1.0 ), returns an ( n, 3 ) array.
+    """
+    h6 = np.asarray( hue, dtype=np.float64 )[ ..., None ] * 6.0
+    return np.clip( np.abs( h6 - [ 3.0, 2.0, 4.0 ] ) * [ 1.0, -1.0, -1.0 ] + [ -1.0, 2.0, 2.0 ], 0.0, 1.0 )
+
+def getPolyTransforms( frame_numbers, hue_freq, scale_freq, rot_freq ) :
+    """
+    Vectorized getPolyTransform, returns arrays of z rotation, hue colour and size.
+    """
+    rquad = np.asarray( frame_numbers, dtype=np.float64 ) * 5.6
+    zrot = np.sin( rquad / 996.3 ) * 9492.0 * rot_freq
+    hueramp = hueToRgb( np.mod( rquad * hue_freq, 1.0 ) )
+    poly_size = np.sin( rquad / 666.3 * scale_freq ) * 5.0
+    return zrot, hueramp, poly_size
+
+# noinspection PyShadowingNames
+def getShutterSamples( frame_number, freq, shutter_length, shutter_fade_width,
+                       shutter_steps, shutter_sum, exposure, offset, hue_freq, scale_freq,
+                       offset_freq, rotfreq, offset_wave_amps, offset_wave_freqs ) :
+    """
+    Returns the ShutterSamples (one array entry per quad) that drawFrame draws
+    for frame_number. Takes the same arguments as drawFrame.
+    """
+    positions, weights = getShutterTable( shutter_steps, shutter_fade_width )
+    shutter_offsets = ( positions - 0.5 ) * shutter_length
+    
+    wave_time = frame_number + shutter_offsets
+    offsets = np.empty( ( shutter_steps, 2 ) )
+    offsets[ :, 0 ] = offset[0] + np.sin( wave_time * offset_wave_freqs[ 0 ] ) * offset_wave_amps[ 0 ]
+    offsets[ :, 1 ] = offset[1] + np.cos( wave_time * offset_wave_freqs[ 1 ] ) * offset_wave_amps[ 0 ]
+    
+    sample_frames = frame_number * freq + shutter_offsets
+    zrot, hueramp, poly_size = getPolyTransforms( sample_frames, hue_freq * freq,
+                                                  scale_freq * freq, rotfreq * freq )
+    
+    return ShutterSamples( weights, weights / shutter_sum * exposure, sample_frames,
+                           offsets, zrot, hueramp, poly_size )
+
 # noinspection PyShadowingNames
 def drawFrame( texture, frame_number, freq, shutter_length, shutter_fade_width,
                shutter_steps, shutter_sum, exposure, offset, hue_freq, scale_freq,
-               offset_freq, rotfreq, offset_wave_amps, offset_wave_freqs ):
+               offset_freq, rotfreq, offset_wave_amps, offset_wave_freqs, batched=True,
+               flip=True, profiler=None ):
     
     # consider replacing this with something that fills with transparent black, to fake up a bit more trail
     glClear( GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT )
     glBindTexture( GL_TEXTURE_2D, texture )
     
-    for i in range( shutter_steps ) :
-        shutter_pos = float( i ) / max( 1.0, float( shutter_steps - 1 ) )
-        sh = getShutter( shutter_pos, shutter_fade_width, 0.001 )
-        shutter_norm = sh / shutter_sum * exposure
-        shutter_offset = (shutter_pos - 0.5) * shutter_length
-        offset_wave = getOffsetWave( frame_number, shutter_offset,
-                                                        offset_wave_amps, offset_wave_freqs )
-        offset_with_wave = [ offs + wav for offs, wav in zip( offset, offset_wave ) ]
-        drawPoly( frame_number * freq + shutter_offset, shutter_norm,
-                  offset_with_wave, hue_freq * freq, scale_freq * freq,
-                  offset_freq * freq, rotfreq * freq )
-        
-    pygame.display.flip()
+    samples = getShutterSamples( frame_number, freq, shutter_length, shutter_fade_width,
+                                 shutter_steps, shutter_sum, exposure, offset, hue_freq,
+                                 scale_freq, offset_freq, rotfreq, offset_wave_amps,
+                                 offset_wave_freqs )
+    if profiler is not None :
+        profiler.mark( 'shutter' )
+    
+    if batched :
+        drawQuadBatch( samples )
+    else :
+        for i in range( shutter_steps ) :
+            drawQuad( samples.zrot[ i ], samples.hue[ i ], samples.poly_size[ i ],
+                      samples.alpha[ i ], samples.offset[ i ] )
+    if profiler is not None :
+        profiler.mark( 'submit' )
+    
+    # callers that read the frame back before it is shown pass flip=False
+    if flip :
+        pygame.display.flip()
 
 def rotate2d( vec, angle_radians ) :
     cos_angle = math.cos( angle_radians )
@@ -168,31 +744,42 @@ def rotate2d( vec, angle_radians ) :
     return [ vec[0] * cos_angle - vec[1] * sin_angle,
              vec[0] * sin_angle + vec[1] * cos_angle ]
 
-# noinspection PyPep8,PyPep8,PyPep8,PyShadowingNames
-def drawPoly( frame_number, alpha, offset, hue_freq, scale_freq, offset_freq, rot_freq ) :
-    
+def getPolyTransform( frame_number, hue_freq, scale_freq, rot_freq ) :
+    """
+    Returns the z rotation (degrees), hue colour and size of the quad drawn for
+    one shutter sample.
+    """
     rquad = frame_number * 5.6
-    glLoadIdentity()
-    glTranslatef(0.0, 0.0, -6.0)
     zrot = math.sin( rquad / 996.3 ) * 9492.0 * rot_freq
-    glRotatef( zrot, 0.0, 0.0, 1.0 )
     
-    glBegin( GL_QUADS )    
-        
     hue = (rquad * hue_freq) % 1.0
     if hue < 0 :
         hue += 1.0
     hueramp = colorsys.hsv_to_rgb( hue, 1.0, 1.0 )
     
-    if hueramp :
-        glColor4f( hueramp[0], hueramp[1], hueramp[2], alpha )
-    else :
-        glColor4f( 1, 1, 1, alpha )
-    
     poly_size = math.sin( rquad / 666.3 * scale_freq ) * 5.0
+    return zrot, hueramp, poly_size
+
+# noinspection PyPep8,PyPep8,PyPep8,PyShadowingNames
+def drawPoly( frame_number, alpha, offset, hue_freq, scale_freq, offset_freq, rot_freq ) :
+    
+    zrot, hueramp, poly_size = getPolyTransform( frame_number, hue_freq, scale_freq, rot_freq )
     
     offsvec2d = [ offset[0], offset[1] ]
     rotate2d( offsvec2d, math.radians( frame_number * offset_freq ) )
+    
+    drawQuad( zrot, hueramp, poly_size, alpha, offsvec2d )
+
+# noinspection PyPep8
+def drawQuad( zrot, hueramp, poly_size, alpha, offsvec2d ) :
+    
+    glLoadIdentity()
+    glTranslatef(0.0, 0.0, -polyDepth)
+    glRotatef( zrot, 0.0, 0.0, 1.0 )
+    
+    glBegin( GL_QUADS )    
+    
+    glColor4f( hueramp[0], hueramp[1], hueramp[2], alpha )
 
     # noinspection PyPep8
     glTexCoord2f(0.0, 0.0) ; glVertex3f( poly_size + offsvec2d[0], poly_size + offsvec2d[1], 0.0) # Bottom Left Of The Texture and Quad
@@ -203,15 +790,371 @@ def drawPoly( frame_number, alpha, offset, hue_freq, scale_freq, offset_freq, ro
     glEnd()
     
     
+# texcoords and vertex signs of the four corners drawn by drawQuad
+quadTexCoords = np.array( [ [ 0.0, 0.0 ], [ 1.0, 0.0 ], [ 1.0, 1.0 ], [ 0.0, 1.0 ] ], dtype=np.float32 )
+quadCorners = np.array( [ [ 1.0, 1.0 ], [ -1.0, 1.0 ], [ -1.0, -1.0 ], [ 1.0, -1.0 ] ] )
+
+# interleaved vertex layout: s, t, r, g, b, a, x, y, z
+quadVertexStride = 9 * 4
+
+def getQuadVertexArray( samples, tex_rect=None ) :
+    """
+    Returns the interleaved eye space vertices of every quad in samples, as a
+    float32 ( n * 4, 9 ) array ready for one glDrawArrays( GL_QUADS ) call.
+    With tex_rect ( s0, t0, s1, t1 ) the texture is taken from that part of
+    the bound texture, e.g. an atlas cell.
+    """
+    numQuads = len( samples.alpha )
+    vertices = np.empty( ( numQuads, 4, 9 ), dtype=np.float32 )
+    if tex_rect is None :
+        vertices[ :, :, 0:2 ] = quadTexCoords
+    else :
+        vertices[ :, :, 0:2 ] = tex_rect[ 0:2 ] + quadTexCoords * ( np.subtract( tex_rect[ 2:4 ], tex_rect[ 0:2 ] ) )
+    vertices[ :, :, 2:5 ] = samples.hue[ :, None, : ]
+    vertices[ :, :, 5 ] = samples.alpha[ :, None ]
+    
+    # the same vertices as drawQuad, put through its glRotatef on the CPU
+    corners = quadCorners * samples.poly_size[ :, None, None ] + samples.offset[ :, None, : ]
+    angles = np.radians( samples.zrot )[ :, None ]
+    cos_angles = np.cos( angles )
+    sin_angles = np.sin( angles )
+    vertices[ :, :, 6 ] = corners[ :, :, 0 ] * cos_angles - corners[ :, :, 1 ] * sin_angles
+    vertices[ :, :, 7 ] = corners[ :, :, 0 ] * sin_angles + corners[ :, :, 1 ] * cos_angles
+    vertices[ :, :, 8 ] = -polyDepth
+    return vertices.reshape( numQuads * 4, 9 )
+
+def drawQuadBatch( samples, tex_rect=None ) :
+    """
+    Draws every quad in samples with a single vertex buffer draw call.
+    """
+    vertices = getQuadVertexArray( samples, tex_rect )
+    
+    glLoadIdentity()
+    glBindBuffer( GL_ARRAY_BUFFER, quadVertexBuffer )
+    glBufferData( GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STREAM_DRAW )
+    
+    glEnableClientState( GL_TEXTURE_COORD_ARRAY )
+    glEnableClientState( GL_COLOR_ARRAY )
+    glEnableClientState( GL_VERTEX_ARRAY )
+    glTexCoordPointer( 2, GL_FLOAT, quadVertexStride, ctypes.c_void_p( 0 ) )
+    glColorPointer( 4, GL_FLOAT, quadVertexStride, ctypes.c_void_p( 2 * 4 ) )
+    glVertexPointer( 3, GL_FLOAT, quadVertexStride, ctypes.c_void_p( 6 * 4 ) )
+    
+    glDrawArrays( GL_QUADS, 0, len( vertices ) )
+    
+    glDisableClientState( GL_VERTEX_ARRAY )
+    glDisableClientState( GL_COLOR_ARRAY )
+    glDisableClientState( GL_TEXTURE_COORD_ARRAY )
+    glBindBuffer( GL_ARRAY_BUFFER, 0 )
+    
+#######################
+# SHUTTER SHADER
+#######################
+
+# drawFrame in one full screen pass: the fragment shader works out every
+# shutter sample's quad from the frame's parameters, as getShutterSamples and
+# drawQuad do, and adds up the texels under the pixel in float before writing
+# it once. Fill and blending cost one pass a pixel instead of one a quad, and
+# the sum is only quantized at the end. GLSL 1.30 runs on Mesa's llvmpipe.
+
+shutterVertexShader = """
+#version 130
+
+uniform vec2 eyeScale;
+out vec2 eyePosition;
+
+void main()
+{
+    // a full screen quad in clip space, and where each pixel is on the quad plane
+    gl_Position = gl_Vertex;
+    eyePosition = gl_Vertex.xy * eyeScale;
+}
+"""
+
+shutterFragmentShader = """
+#version 130
+
+uniform sampler2D quadTexture;
+uniform float textureSize;
+uniform float pixelSize;
+
+uniform int shutterSteps;
+uniform float shutterCentre;
+uniform float shutterLength;
+uniform float fadeWidth;
+uniform float exposureScale;
+uniform float frameNumber;
+uniform vec2 offset;
+uniform vec2 waveAmps;
+uniform vec2 waveFreqs;
+uniform float hueFreq;
+uniform float scaleFreq;
+uniform float rotFreq;
+
+in vec2 eyePosition;
+
+// smoothstepArray, including its step for equal edges
+float ramp( float x, float edge0, float edge1 )
+{
+    if ( edge1 > edge0 )
+        return smoothstep( edge0, edge1, x );
+    return x > edge0 ? 1.0 : 0.0;
+}
+
+void main()
+{
+    vec3 sum = vec3( 0.0 );
+    float positionStep = 1.0 / max( 1.0, float( shutterSteps - 1 ) );
+    
+    for ( int i = 0; i < shutterSteps; i++ )
+    {
+        // getShutterTable
+        float position = float( i ) * positionStep;
+        float weight = ramp( position, 0.0, fadeWidth ) * ( 1.0 - ramp( position, 1.0 - fadeWidth, 1.0 ) );
+        weight = weight * 0.999 + 0.001;
+        
+        // getShutterSamples and getPolyTransforms
+        float shutterOffset = ( position - 0.5 ) * shutterLength;
+        float waveTime = frameNumber + shutterOffset;
+        vec2 quadOffset = offset + vec2( sin( waveTime * waveFreqs.x ), cos( waveTime * waveFreqs.y ) ) * waveAmps.x;
+        float rquad = ( shutterCentre + shutterOffset ) * 5.6;
+        float polySize = sin( rquad / 666.3 * scaleFreq ) * 5.0;
+        if ( polySize == 0.0 )
+            continue;
+        float zrot = radians( sin( rquad / 996.3 ) * 9492.0 * rotFreq );
+        vec3 hue = clamp( abs( fract( rquad * hueFreq ) * 6.0 - vec3( 3.0, 2.0, 4.0 ) ) * vec3( 1.0, -1.0, -1.0 )
+                          + vec3( -1.0, 2.0, 2.0 ), 0.0, 1.0 );
+        
+        // drawQuad backwards: undo the rotation, then the vertex to texcoord mapping
+        float c = cos( zrot );
+        float s = sin( zrot );
+        vec2 q = vec2( eyePosition.x * c + eyePosition.y * s, eyePosition.y * c - eyePosition.x * s );
+        vec2 uv = ( 1.0 - ( q - quadOffset ) / polySize ) * 0.5;
+        if ( all( greaterThanEqual( uv, vec2( 0.0 ) ) ) && all( lessThan( uv, vec2( 1.0 ) ) ) )
+        {
+            // the quad faces the camera, so one mip level covers all of it
+            float lod = log2( textureSize * pixelSize / ( 2.0 * abs( polySize ) ) );
+            sum += textureLod( quadTexture, uv, lod ).rgb * hue * weight;
+        }
+    }
+    gl_FragColor = vec4( sum * exposureScale, 1.0 );
+}
+"""
+
+def compileProgram( vertex_source, fragment_source ) :
+    """
+    Compiles and links a GLSL program, raising RuntimeError if that fails.
+    """
+    # only imported here, as most sessions never compile a shader
+    from OpenGL.GL import shaders
+    return shaders.compileProgram( shaders.compileShader( vertex_source, GL_VERTEX_SHADER ),
+                                   shaders.compileShader( fragment_source, GL_FRAGMENT_SHADER ) )
+
+def getShutterShader() :
+    """
+    Returns the drawFrameShader program, compiling it for the current context.
+    """
+    # programs belong to the context, so a new one is needed if set_mode replaced it
+    global shutterShaderProgram
+    if shutterShaderProgram is None or not glIsProgram( shutterShaderProgram ) :
+        shutterShaderProgram = compileProgram( shutterVertexShader, shutterFragmentShader )
+    return shutterShaderProgram
+
+# noinspection PyShadowingNames
+def drawFrameShader( texture, frame_number, freq, shutter_length, shutter_fade_width,
+                     shutter_steps, shutter_sum, exposure, offset, hue_freq, scale_freq,
+                     offset_freq, rotfreq, offset_wave_amps, offset_wave_freqs,
+                     flip=True, profiler=None ) :
+    """
+    Draws the same frame as drawFrame in a single shader pass. Raises
+    RuntimeError if the GL has no GLSL 1.30.
+    """
+    program = getShutterShader()
+    viewport = glGetIntegerv( GL_VIEWPORT )
+    frameWidth, frameHeight = int( viewport[2] ), max( 1, int( viewport[3] ) )
+    focal = 1.0 / math.tan( math.radians( fieldOfView ) / 2.0 )
+    eyeScaleY = polyDepth / focal
+    eyeScaleX = eyeScaleY * frameWidth / frameHeight
+    
+    glClear( GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT )
+    glBindTexture( GL_TEXTURE_2D, texture )
+    glUseProgram( program )
+    
+    def setUniform( name, setter, *values ) :
+        setter( glGetUniformLocation( program, name ), *values )
+    
+    setUniform( 'quadTexture', glUniform1i, 0 )
+    setUniform( 'textureSize', glUniform1f,
+                max( glGetTexLevelParameteriv( GL_TEXTURE_2D, 0, GL_TEXTURE_WIDTH ),
+                     glGetTexLevelParameteriv( GL_TEXTURE_2D, 0, GL_TEXTURE_HEIGHT ) ) )
+    setUniform( 'pixelSize', glUniform1f, 2.0 * eyeScaleX / frameWidth )
+    setUniform( 'eyeScale', glUniform2f, eyeScaleX, eyeScaleY )
+    setUniform( 'shutterSteps', glUniform1i, shutter_steps )
+    setUniform( 'shutterCentre', glUniform1f, frame_number * freq )
+    setUniform( 'shutterLength', glUniform1f, shutter_length )
+    setUniform( 'fadeWidth', glUniform1f, shutter_fade_width )
+    setUniform( 'exposureScale', glUniform1f, exposure / shutter_sum )
+    setUniform( 'frameNumber', glUniform1f, frame_number )
+    setUniform( 'offset', glUniform2f, offset[0], offset[1] )
+    setUniform( 'waveAmps', glUniform2f, offset_wave_amps[0], offset_wave_amps[1] )
+    setUniform( 'waveFreqs', glUniform2f, offset_wave_freqs[0], offset_wave_freqs[1] )
+    setUniform( 'hueFreq', glUniform1f, hue_freq * freq )
+    setUniform( 'scaleFreq', glUniform1f, scale_freq * freq )
+    setUniform( 'rotFreq', glUniform1f, rotfreq * freq )
+    if profiler is not None :
+        profiler.mark( 'shutter' )
+    
+    glBegin( GL_QUADS )
+    glVertex2f( -1.0, -1.0 )
+    glVertex2f( 1.0, -1.0 )
+    glVertex2f( 1.0, 1.0 )
+    glVertex2f( -1.0, 1.0 )
+    glEnd()
+    glUseProgram( 0 )
+    if profiler is not None :
+        profiler.mark( 'submit' )
+    
+    if flip :
+        pygame.display.flip()
+
+#######################
+# FLOAT ACCUMULATION
+#######################
+
+# Blended into the 8 bit window, every sample's exposure / shutter_sum share of
+# a quad is quantized on its own, and faint ones vanish. Drawn into a
+# FloatFramebuffer instead, samples add up in float32 and are quantized once,
+# when resolve() applies the exposure and a tone map on the way to the window,
+# so fewer samples give a clean frame. Software frames are float already and go
+# through toneMapImage.
+
+# tone maps by name: a numpy function of a linear float image, and the same as a
+# GLSL expression of the vec3 colour
+toneMaps = {
+    'linear' : ( lambda image : image, "colour" ),
+    'reinhard' : ( lambda image : image / ( 1.0 + image ), "colour / ( 1.0 + colour )" ),
+    'exponential' : ( lambda image : 1.0 - np.exp( -image ), "1.0 - exp( -colour )" ),
+}
+
+def toneMapImage( image, exposure=1.0, tone_map='linear' ) :
+    """
+    Scales a linear float image by exposure and applies one of toneMaps.
+    """
+    return toneMaps[ tone_map ][ 0 ]( image * np.float32( exposure ) ).astype( np.float32, copy=False )
+
+resolveVertexShader = """
+#version 130
+
+out vec2 texCoord;
+
+void main()
+{
+    gl_Position = gl_Vertex;
+    texCoord = gl_Vertex.xy * 0.5 + 0.5;
+}
+"""
+
+resolveFragmentShader = """
+#version 130
+
+uniform sampler2D accumulation;
+uniform float exposure;
+in vec2 texCoord;
+
+void main()
+{
+    vec3 colour = texture( accumulation, texCoord ).rgb * exposure;
+    gl_FragColor = vec4( %s, 1.0 );
+}
+"""
+
+class FloatFramebuffer( object ) :
+    """
+    A float32 render target: frames drawn after bind() accumulate in it
+    instead of the window, and resolve() tone maps them into the window.
+    With smooth a target smaller than the window is scaled up bilinearly.
+    Raises RuntimeError if the GL cannot render to float textures.
+    """
+    def __init__( self, frame_width=width, frame_height=height, smooth=False ) :
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.programs = {}
+        
+        self.texture = glGenTextures( 1 )
+        glBindTexture( GL_TEXTURE_2D, self.texture )
+        textureFilter = GL_LINEAR if smooth else GL_NEAREST
+        glTexParameteri( GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, textureFilter )
+        glTexParameteri( GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, textureFilter )
+        glTexImage2D( GL_TEXTURE_2D, 0, GL_RGBA32F, frame_width, frame_height, 0, GL_RGBA, GL_FLOAT, None )
+        
+        self.framebuffer = glGenFramebuffers( 1 )
+        glBindFramebuffer( GL_FRAMEBUFFER, self.framebuffer )
+        glFramebufferTexture2D( GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.texture, 0 )
+        status = glCheckFramebufferStatus( GL_FRAMEBUFFER )
+        glBindFramebuffer( GL_FRAMEBUFFER, 0 )
+        if status != GL_FRAMEBUFFER_COMPLETE :
+            self.close()
+            raise RuntimeError( "float framebuffer incomplete, status 0x%x" % status )
+    
+    def bind( self ) :
+        glBindFramebuffer( GL_FRAMEBUFFER, self.framebuffer )
+    
+    def getProgram( self, tone_map ) :
+        if tone_map not in self.programs :
+            self.programs[ tone_map ] = compileProgram( resolveVertexShader,
+                                                        resolveFragmentShader % toneMaps[ tone_map ][ 1 ] )
+        return self.programs[ tone_map ]
+    
+    def resolve( self, exposure=1.0, tone_map='linear' ) :
+        """
+        Draws the accumulated frame into the window, scaled by exposure and
+        tone mapped, and leaves the window bound.
+        """
+        program = self.getProgram( tone_map )
+        glBindFramebuffer( GL_FRAMEBUFFER, 0 )
+        glBindTexture( GL_TEXTURE_2D, self.texture )
+        glUseProgram( program )
+        glUniform1i( glGetUniformLocation( program, 'accumulation' ), 0 )
+        glUniform1f( glGetUniformLocation( program, 'exposure' ), exposure )
+        
+        glDisable( GL_BLEND )
+        glBegin( GL_QUADS )
+        glVertex2f( -1.0, -1.0 )
+        glVertex2f( 1.0, -1.0 )
+        glVertex2f( 1.0, 1.0 )
+        glVertex2f( -1.0, 1.0 )
+        glEnd()
+        glEnable( GL_BLEND )
+        glUseProgram( 0 )
+    
+    def readImage( self ) :
+        """
+        Returns the accumulated frame as a float32 ( height, width, 3 ) image,
+        bottom row first like drawFrameSoftware's.
+        """
+        glBindTexture( GL_TEXTURE_2D, self.texture )
+        data = glGetTexImage( GL_TEXTURE_2D, 0, GL_RGB, GL_FLOAT )
+        return np.frombuffer( data, dtype=np.float32 ).reshape( self.frame_height, self.frame_width, 3 )
+    
+    def close( self ) :
+        for program in self.programs.values() :
+            glDeleteProgram( program )
+        self.programs = {}
+        glDeleteFramebuffers( 1, [ self.framebuffer ] )
+        glDeleteTextures( [ self.texture ] )
+
+def getFrameFilename( frame_number, directory=renderFiles, name=animName ) :
+    # format number with zero padding: 001, 002, etc
+    fileNumber = str(frame_number).zfill( 4 )
+    return '%s/%s_%s.%s' % (directory, name, fileNumber, fileFormat.lower())
+
 def writeFrame( write_screen, write_frameNumber ):
     """
     Writes frame image to file.
     """
-    # format number with zero padding: 001, 002, etc
-    fileNumber = str(write_frameNumber).zfill( 4 )
     # create filename for frame
     # frameFilename1 = '%s/%s_%s.tga' % (renderFiles, animName, fileNumber)
-    frameFilename2 = '%s/%s_%s.%s' % (renderFiles, animName, fileNumber, fileFormat.lower())
+    frameFilename2 = getFrameFilename( write_frameNumber )
     
     # write file
     print( "writing image file: " + str( frameFilename2 ) )
@@ -223,6 +1166,1318 @@ def writeFrame( write_screen, write_frameNumber ):
         
     # image.save( frameFilename2, fileFormat )
 
+def writePng( filename, pixels ) :
+    """
+    Writes a ( height, width, 3 or 4 ) uint8 or uint16 array, top row first,
+    as an 8 or 16 bit PNG. Unlike pygame.image.save this lets other threads
+    run while compressing.
+    """
+    pngWriter = PngStreamWriter( filename, pixels.shape[1], pixels.shape[0], pixels.shape[2], pixels.dtype )
+    pngWriter.writeRows( pixels )
+    pngWriter.close()
+
+class PngStreamWriter( object ) :
+    """
+    Writes a PNG a band of rows at a time, top row first, compressing each
+    band as it arrives, so the whole image never needs to be in memory.
+    """
+    def __init__( self, filename, frame_width, frame_height, channels=3, dtype=np.uint8 ) :
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.channels = channels
+        self.dtype = np.dtype( dtype )
+        if self.dtype == np.uint16 :
+            bitDepth = 16
+        elif self.dtype == np.uint8 :
+            bitDepth = 8
+        else :
+            raise ValueError( "PNG frames must be uint8 or uint16, not %s" % self.dtype )
+        colourType = { 3 : 2, 4 : 6 }[ channels ]
+        self.rows_written = 0
+        self.compressor = zlib.compressobj( 6 )
+        
+        self.png_file = open( filename, 'wb' )
+        self.png_file.write( b"\x89PNG\r\n\x1a\n" )
+        self.writeChunk( b"IHDR", struct.pack( ">IIBBBBB", frame_width, frame_height, bitDepth, colourType, 0, 0, 0 ) )
+    
+    def writeChunk( self, chunk_type, data ) :
+        self.png_file.write( struct.pack( ">I", len( data ) ) + chunk_type + data +
+                             struct.pack( ">I", zlib.crc32( chunk_type + data ) & 0xffffffff ) )
+    
+    def writeRows( self, pixels ) :
+        """
+        Adds ( rows, width, channels ) pixels below those already written.
+        """
+        rows = pixels.shape[0]
+        if pixels.dtype != self.dtype or pixels.shape[ 1: ] != ( self.frame_width, self.channels ) :
+            raise ValueError( "expected rows of %d x %d %s, not %s %s" % ( self.frame_width, self.channels,
+                                                                           self.dtype, pixels.shape[ 1: ], pixels.dtype ) )
+        if self.dtype == np.uint16 :
+            # PNG samples are big endian
+            rowBytes = pixels.astype( ">u2" ).view( np.uint8 ).reshape( rows, -1 )
+        else :
+            rowBytes = pixels.reshape( rows, -1 )
+        
+        # every scanline starts with filter type 0 (none)
+        scanlines = np.zeros( ( rows, rowBytes.shape[1] + 1 ), dtype=np.uint8 )
+        scanlines[ :, 1: ] = rowBytes
+        # consecutive IDAT chunks are one compressed stream
+        data = self.compressor.compress( scanlines.tobytes() )
+        if data :
+            self.writeChunk( b"IDAT", data )
+        self.rows_written += rows
+    
+    def close( self ) :
+        if self.rows_written != self.frame_height :
+            self.png_file.close()
+            raise ValueError( "%d of %d rows written" % ( self.rows_written, self.frame_height ) )
+        self.writeChunk( b"IDAT", self.compressor.flush() )
+        self.writeChunk( b"IEND", b"" )
+        self.png_file.close()
+
+#######################
+# FRAME SINKS
+#######################
+
+# Where recorded frames go. A sink's write( pixels, frame_number ) takes a
+# ( height, width, 4 ) RGBA array, bottom row first as read back from GL
+# (see imageToPixels for software renders), of one of the pixelDepths named in
+# the sink's depths. Sinks with ordered = True write a single stream, so their
+# frames must arrive one at a time and in order.
+
+# frame sink sample types by name: 8 and 16 bit, and linear float
+pixelDepths = { '8' : np.uint8, '16' : np.uint16, 'float' : np.float32 }
+
+class PngSink( object ) :
+    """
+    Writes every frame to its own numbered PNG file. The framebuffer alpha is
+    not meaningful with additive blending, so only RGB is saved.
+    """
+    ordered = False
+    depths = ( '8', '16' )
+    
+    def __init__( self, directory=renderFiles, name=animName ) :
+        self.directory = directory
+        self.name = name
+        if not os.path.isdir( directory ) :
+            os.makedirs( directory )
+    
+    def write( self, pixels, frame_number ) :
+        writePng( getFrameFilename( frame_number, self.directory, self.name ), pixels[ ::-1, :, :3 ] )
+    
+    def writeBands( self, pixel_bands, frame_number, frame_width, frame_height ) :
+        """
+        Streams a frame too big to hold whole into its PNG, from bands of
+        imageToPixels pixels in file order, e.g. from iterTiledBands.
+        """
+        pngWriter = None
+        for pixels in pixel_bands :
+            if pngWriter is None :
+                pngWriter = PngStreamWriter( getFrameFilename( frame_number, self.directory, self.name ),
+                                             frame_width, frame_height, 3, pixels.dtype )
+            pngWriter.writeRows( pixels[ :, :, :3 ] )
+        pngWriter.close()
+    
+    def close( self ) :
+        pass
+
+class RawSink( object ) :
+    """
+    Streams frames as raw RGBA samples, top row first, into one file, or to
+    stdout when output is '-', e.g. for
+    ffmpeg -f rawvideo -pix_fmt rgba -s 1024x1024 -i - out.mp4
+    16 bit frames are rgba64le, float ones native float32.
+    """
+    ordered = True
+    depths = ( '8', '16', 'float' )
+    
+    def __init__( self, output ) :
+        self.stdout = None
+        if output == '-' :
+            self.stream = sys.stdout.buffer
+            # keep prints out of the frame stream until close() puts stdout back
+            self.stdout = sys.stdout
+            sys.stdout = sys.stderr
+        else :
+            self.stream = open( output, 'wb' )
+    
+    def write( self, pixels, frame_number ) :
+        self.stream.write( pixels[ ::-1 ].tobytes() )
+    
+    def close( self ) :
+        self.stream.flush()
+        if self.stdout is None :
+            self.stream.close()
+        elif sys.stdout is sys.stderr :
+            sys.stdout = self.stdout
+            self.stdout = None
+
+class Y4mSink( RawSink ) :
+    """
+    Streams frames as YUV4MPEG2 (4:4:4, BT.601), which encoders read without
+    being told the frame size, e.g. ffmpeg -i - out.mp4
+    """
+    
+    rgbToYuv = np.array( [ [ 65.481, 128.553, 24.966 ],
+                           [ -37.797, -74.203, 112.0 ],
+                           [ 112.0, -93.786, -18.214 ] ], dtype=np.float32 ) / 255.0
+    yuvOffsets = np.array( [ 16.0, 128.0, 128.0 ], dtype=np.float32 )
+    depths = ( '8', )
+    
+    def __init__( self, output, frame_rate=30 ) :
+        RawSink.__init__( self, output )
+        self.frame_rate = frame_rate
+        self.header_written = False
+    
+    def write( self, pixels, frame_number ) :
+        if not self.header_written :
+            self.stream.write( ( "YUV4MPEG2 W%d H%d F%d:1 Ip A1:1 C444\n" %
+                                 ( pixels.shape[1], pixels.shape[0], self.frame_rate ) ).encode( "ascii" ) )
+            self.header_written = True
+        
+        rgb = pixels[ ::-1, :, :3 ].astype( np.float32 )
+        yuv = np.dot( rgb, self.rgbToYuv.T ) + self.yuvOffsets
+        planes = np.clip( yuv + 0.5, 0, 255 ).astype( np.uint8 ).transpose( 2, 0, 1 )
+        self.stream.write( b"FRAME\n" )
+        self.stream.write( planes.tobytes() )
+
+# fixed so the header can be rewritten in place when the file grows
+npyHeaderSize = 128
+
+def writeNpyHeader( npy_file, shape, dtype ) :
+    header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % ( np.dtype( dtype ).str, tuple( shape ) )
+    npy_file.seek( 0 )
+    npy_file.write( b"\x93NUMPY\x01\x00" + struct.pack( "<H", npyHeaderSize - 10 ) +
+                    header.ljust( npyHeaderSize - 11 ).encode( "latin1" ) + b"\n" )
+
+class MemmapSink( object ) :
+    """
+    Writes every frame into one memory mapped ( frames, height, width, 4 )
+    .npy stack, top row first, indexed by frame number less first_frame, of
+    the first frame's dtype. The file grows as needed and is trimmed to the
+    last written frame on close, so it can be opened with
+    numpy.load( output, mmap_mode='r' ).
+    """
+    ordered = False
+    depths = ( '8', '16', 'float' )
+    
+    def __init__( self, output, frame_capacity=64, first_frame=0 ) :
+        self.output = output
+        self.frame_capacity = frame_capacity
+        self.first_frame = first_frame
+        self.frames = None
+        self.frame_shape = None
+        self.frame_dtype = None
+        self.frame_count = 0
+        self.lock = threading.Lock()
+    
+    def resize( self, frame_capacity ) :
+        if self.frames is not None :
+            self.frames.flush()
+            self.frames = None
+        frameBytes = int( np.prod( self.frame_shape ) ) * self.frame_dtype.itemsize
+        mode = 'r+b' if os.path.exists( self.output ) else 'w+b'
+        with open( self.output, mode ) as npyFile :
+            npyFile.truncate( npyHeaderSize + frame_capacity * frameBytes )
+            writeNpyHeader( npyFile, ( frame_capacity, ) + self.frame_shape, self.frame_dtype )
+        self.frame_capacity = frame_capacity
+        if frame_capacity > 0 :
+            self.frames = np.memmap( self.output, dtype=self.frame_dtype, mode='r+', offset=npyHeaderSize,
+                                     shape=( frame_capacity, ) + self.frame_shape )
+    
+    def write( self, pixels, frame_number ) :
+        if frame_number < self.first_frame :
+            raise ValueError( "frame %d is before the first frame of the stack, %d" % ( frame_number, self.first_frame ) )
+        frame_number -= self.first_frame
+        with self.lock :
+            if self.frame_shape is None :
+                self.frame_shape = pixels.shape
+                self.frame_dtype = pixels.dtype
+                if os.path.exists( self.output ) :
+                    os.remove( self.output )
+                self.resize( max( self.frame_capacity, frame_number + 1 ) )
+            elif frame_number >= self.frame_capacity :
+                self.resize( max( frame_number + 1, self.frame_capacity * 2 ) )
+            self.frames[ frame_number ] = pixels[ ::-1 ]
+            self.frame_count = max( self.frame_count, frame_number + 1 )
+    
+    def close( self ) :
+        with self.lock :
+            if self.frame_shape is not None :
+                self.resize( self.frame_count )
+
+frameSinks = { 'png' : PngSink, 'raw' : RawSink, 'y4m' : Y4mSink, 'memmap' : MemmapSink }
+frameSinkOutputs = { 'png' : renderFiles,
+                     'raw' : '%s/%s.rgba' % ( renderFiles, animName ),
+                     'y4m' : '%s/%s.y4m' % ( renderFiles, animName ),
+                     'memmap' : '%s/%s.npy' % ( renderFiles, animName ) }
+
+def makeFrameSink( sink_type, output=None, first_frame=0 ) :
+    """
+    Creates one of the frameSinks by name, writing to output or to its default
+    location in renderFiles. first_frame is the lowest frame number that will
+    be written, which the memmap sink stores first.
+    """
+    if output is None :
+        output = frameSinkOutputs[ sink_type ]
+        if not os.path.isdir( renderFiles ) :
+            os.makedirs( renderFiles )
+    if frameSinks[ sink_type ] is MemmapSink :
+        return MemmapSink( output, first_frame=first_frame )
+    return frameSinks[ sink_type ]( output )
+
+#######################
+# FRAME CACHE
+#######################
+
+# A rendered frame is a function of its frame number, parameters, texture,
+# size, depth and renderer only, so it is cached under a hash of those: the
+# texture by its contents, so a renamed or touched file still hits. Re-rendering
+# a take after changing part of it then only draws the frames that changed.
+# Least recently used frames are deleted once the cache is over its size.
+
+@functools.lru_cache( maxsize=256 )
+def getFileDigest( filename, modified_time, file_size ) :
+    # keyed by modification time and size, so a file is hashed again when edited
+    digest = hashlib.sha1()
+    with open( filename, 'rb' ) as contentFile :
+        for block in iter( lambda : contentFile.read( 1024 * 1024 ), b'' ) :
+            digest.update( block )
+    return digest.hexdigest()
+
+def getTextureDigest( texture_file ) :
+    """
+    Returns the sha1 of texture_file's contents.
+    """
+    fileStat = os.stat( texture_file )
+    return getFileDigest( os.path.abspath( texture_file ), fileStat.st_mtime_ns, fileStat.st_size )
+
+class FrameCache( object ) :
+    """
+    Keeps imageToPixels frames on disk under getKey() keys, within max_bytes.
+    
+    get() marks a frame used by touching its file, and put() deletes the least
+    recently used frames down to nine tenths of max_bytes when it goes over,
+    so several renders can share the directory.
+    """
+    
+    def __init__( self, directory=frameCacheDir, max_bytes=frameCacheBytes ) :
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir( directory ) :
+            os.makedirs( directory )
+        self.total_bytes = 0
+        for entry in os.scandir( directory ) :
+            if entry.name.endswith( '.npy' ) :
+                try :
+                    self.total_bytes += entry.stat().st_size
+                except OSError :
+                    # evicted by another render since the scan
+                    continue
+        self.hits = 0
+        self.evictions = 0
+    
+    def getKey( self, frame_number, texture_file, parameters, frame_width, frame_height, depth='8',
+                renderer='software' ) :
+        key = { 'version' : frameCacheVersion, 'frame' : frame_number, 'texture' : getTextureDigest( texture_file ),
+                'parameters' : parameters, 'size' : [ frame_width, frame_height ], 'depth' : depth,
+                'renderer' : renderer }
+        return hashlib.sha1( json.dumps( key, sort_keys=True ).encode( 'utf-8' ) ).hexdigest()
+    
+    def getFilename( self, key ) :
+        return os.path.join( self.directory, key + '.npy' )
+    
+    def touch( self, key ) :
+        """
+        Marks the frame for key used, so it is not evicted soon, returning
+        False if it is not cached.
+        """
+        try :
+            os.utime( self.getFilename( key ) )
+        except OSError :
+            return False
+        return True
+    
+    def get( self, key ) :
+        """
+        Returns the cached pixels for key, or None. An entry that cannot be
+        read, left empty or cut short by a crashed render, is deleted.
+        """
+        filename = self.getFilename( key )
+        try :
+            pixels = np.load( filename )
+            os.utime( filename )
+        except FileNotFoundError :
+            return None
+        except ( OSError, ValueError, EOFError ) :
+            self.remove( filename )
+            return None
+        self.hits += 1
+        return pixels
+    
+    def remove( self, filename ) :
+        try :
+            fileSize = os.path.getsize( filename )
+            os.remove( filename )
+        except OSError :
+            return
+        self.total_bytes -= fileSize
+    
+    def put( self, key, pixels ) :
+        # write then rename, so other renders never load a partial frame
+        tempFilename = None
+        try :
+            tempHandle, tempFilename = tempfile.mkstemp( dir=self.directory, suffix=".tmp" )
+            with os.fdopen( tempHandle, 'wb' ) as tempFile :
+                np.save( tempFile, pixels )
+            os.replace( tempFilename, self.getFilename( key ) )
+        except OSError as e :
+            print( "Could not cache frame: %s" % e )
+            if tempFilename is not None :
+                try :
+                    os.remove( tempFilename )
+                except OSError :
+                    pass
+            return
+        self.total_bytes += os.path.getsize( self.getFilename( key ) )
+        if self.total_bytes > self.max_bytes :
+            self.evict( self.max_bytes * 9 // 10 )
+    
+    def evict( self, target_bytes ) :
+        self.total_bytes, evicted = evictLeastRecentlyUsed( self.directory, target_bytes )
+        self.evictions += evicted
+    
+    def getStats( self ) :
+        return { 'hits' : self.hits, 'evictions' : self.evictions, 'bytes' : self.total_bytes }
+
+#######################
+# RECORDING
+#######################
+
+class FrameRecorder( object ) :
+    """
+    Records frames without stalling the main loop.
+    
+    capture() starts an asynchronous glReadPixels into one of two pixel buffer
+    objects and collects the previous frame from the other, so the readback
+    overlaps with drawing the next frame. The pixels are copied into one of
+    max_pending preallocated buffers and written to the sink by a pool of
+    worker threads (a single one for ordered sinks).
+    When every buffer is still waiting to be written the frame is dropped, or
+    with drop_when_full=False the main loop waits for a writer to finish.
+    The sink is not closed with the recorder, so it can outlive it.
+    """
+    
+    def __init__( self, frame_width, frame_height, sink,
+                  workers=2, max_pending=8, drop_when_full=True ) :
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.sink = sink
+        self.drop_when_full = drop_when_full
+        self.frame_bytes = frame_width * frame_height * 4
+        
+        self.pixel_buffers = glGenBuffers( 2 )
+        for pbo in self.pixel_buffers :
+            glBindBuffer( GL_PIXEL_PACK_BUFFER, pbo )
+            glBufferData( GL_PIXEL_PACK_BUFFER, self.frame_bytes, None, GL_STREAM_READ )
+        glBindBuffer( GL_PIXEL_PACK_BUFFER, 0 )
+        self.next_buffer = 0
+        # frame number waiting in each pixel buffer, or None
+        self.buffer_frames = [ None, None ]
+        
+        self.free_frames = queue.Queue()
+        for i in range( max_pending ) :
+            self.free_frames.put( np.empty( ( frame_height, frame_width, 4 ), dtype=np.uint8 ) )
+        if sink.ordered :
+            workers = 1
+        self.executor = concurrent.futures.ThreadPoolExecutor( max_workers=workers )
+        
+        self.lock = threading.Lock()
+        self.captured = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.pending = 0
+        self.max_pending_seen = 0
+    
+    def capture( self, frame_number ) :
+        """
+        Queues the frame in the back buffer, call before pygame.display.flip().
+        """
+        pbo = self.pixel_buffers[ self.next_buffer ]
+        glReadBuffer( GL_BACK )
+        glBindBuffer( GL_PIXEL_PACK_BUFFER, pbo )
+        glReadPixels( 0, 0, self.frame_width, self.frame_height,
+                      GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p( 0 ) )
+        glBindBuffer( GL_PIXEL_PACK_BUFFER, 0 )
+        self.buffer_frames[ self.next_buffer ] = frame_number
+        self.captured += 1
+        
+        # the other buffer was filled last frame, so its transfer is done by now
+        self.next_buffer = 1 - self.next_buffer
+        self.collect( self.next_buffer )
+    
+    def collect( self, buffer_index ) :
+        frame_number = self.buffer_frames[ buffer_index ]
+        if frame_number is None :
+            return
+        self.buffer_frames[ buffer_index ] = None
+        
+        try :
+            pixels = self.free_frames.get( block=not self.drop_when_full )
+        except queue.Empty :
+            with self.lock :
+                self.dropped += 1
+            return
+        
+        glBindBuffer( GL_PIXEL_PACK_BUFFER, self.pixel_buffers[ buffer_index ] )
+        address = glMapBuffer( GL_PIXEL_PACK_BUFFER, GL_READ_ONLY )
+        if address :
+            ctypes.memmove( pixels.ctypes.data, address, self.frame_bytes )
+            glUnmapBuffer( GL_PIXEL_PACK_BUFFER )
+        glBindBuffer( GL_PIXEL_PACK_BUFFER, 0 )
+        if not address :
+            self.free_frames.put( pixels )
+            with self.lock :
+                self.dropped += 1
+            return
+        
+        with self.lock :
+            self.pending += 1
+            self.max_pending_seen = max( self.max_pending_seen, self.pending )
+        self.executor.submit( self.write, pixels, frame_number )
+    
+    def write( self, pixels, frame_number ) :
+        try :
+            self.sink.write( pixels, frame_number )
+            succeeded = True
+        except Exception as e :
+            print( "Failed writing frame %d: %s" % ( frame_number, e ) )
+            succeeded = False
+        finally :
+            self.free_frames.put( pixels )
+        
+        with self.lock :
+            self.pending -= 1
+            if succeeded :
+                self.written += 1
+            else :
+                self.failed += 1
+    
+    def getStats( self ) :
+        with self.lock :
+            return { 'captured' : self.captured, 'written' : self.written,
+                     'dropped' : self.dropped, 'failed' : self.failed,
+                     'queue_depth' : self.pending, 'max_queue_depth' : self.max_pending_seen }
+    
+    def close( self ) :
+        """
+        Collects the last frames, waits for the writers and frees the buffers.
+        """
+        for i in range( 2 ) :
+            self.next_buffer = 1 - self.next_buffer
+            self.collect( self.next_buffer )
+        self.executor.shutdown( wait=True )
+        glDeleteBuffers( 2, self.pixel_buffers )
+        return self.getStats()
+
+#######################
+# ADAPTIVE SAMPLING
+#######################
+
+class AdaptiveSampler( object ) :
+    """
+    Chooses how many shutter samples to draw each frame of the live view.
+    
+    While there is input, the count is scaled by how far the last frame was
+    from target_frame_time. Once input has been idle for idle_delay seconds
+    it grows by refine_rate a frame until it reaches the full count again.
+    Counts above 32 are rounded to multiples of 8 so the shutter table cache
+    keeps hitting; callers normalize with getShutterSum of the returned count.
+    """
+    
+    def __init__( self, target_frame_time=1.0 / adaptiveTargetFps, min_samples=16,
+                  idle_delay=0.5, refine_rate=1.5 ) :
+        self.target_frame_time = target_frame_time
+        self.min_samples = min_samples
+        self.idle_delay = idle_delay
+        self.refine_rate = refine_rate
+        self.samples = None
+        self.idle = False
+    
+    def getSamples( self, full_samples, idle ) :
+        """
+        Returns the sample count for this frame, at most full_samples.
+        """
+        self.idle = idle
+        if self.samples is None :
+            self.samples = float( full_samples )
+        elif idle :
+            self.samples *= self.refine_rate
+        self.samples = min( max( self.samples, min( self.min_samples, full_samples ) ), full_samples )
+        
+        samples = int( self.samples )
+        if samples > 32 and samples != full_samples :
+            samples = min( full_samples, int( round( samples / 8.0 ) ) * 8 )
+        return max( 1, samples )
+    
+    def update( self, frame_time ) :
+        """
+        Takes the time the last frame took, after it was drawn with getSamples().
+        """
+        if self.idle or frame_time <= 0.0 or self.samples is None :
+            return
+        # damped, so one slow frame (a texture upload, say) does not crash the count
+        ratio = min( max( self.target_frame_time / frame_time, 0.5 ), 1.5 )
+        self.samples *= ratio ** 0.5
+
+#######################
+# PROFILING
+#######################
+
+# stages of the main loop that FrameProfiler times, in loop order
+profileStages = ( 'texture', 'shutter', 'submit', 'record', 'flip', 'events' )
+
+class FrameProfiler( object ) :
+    """
+    Times each stage of the main loop into a ring buffer of the last history
+    frames. Call startFrame(), then mark( stage ) as each stage finishes and
+    endFrame() after the last; time not covered by a stage only shows in the
+    frame total.
+    """
+    
+    def __init__( self, stages=profileStages, history=600 ) :
+        self.stages = list( stages )
+        self.stage_columns = dict( ( stage, i ) for i, stage in enumerate( self.stages ) )
+        # one row per frame: the stage times, then the whole frame's time
+        self.times = np.zeros( ( history, len( self.stages ) + 1 ) )
+        self.frame_numbers = np.zeros( history, dtype=np.int64 )
+        self.frame_count = 0
+        self.frame_start = None
+        self.last_mark = None
+    
+    def startFrame( self ) :
+        row = self.frame_count % len( self.times )
+        self.times[ row ] = 0.0
+        self.frame_start = self.last_mark = time.perf_counter()
+    
+    def mark( self, stage ) :
+        now = time.perf_counter()
+        self.times[ self.frame_count % len( self.times ), self.stage_columns[ stage ] ] += now - self.last_mark
+        self.last_mark = now
+    
+    def endFrame( self ) :
+        row = self.frame_count % len( self.times )
+        self.times[ row, -1 ] = time.perf_counter() - self.frame_start
+        self.frame_numbers[ row ] = self.frame_count
+        self.frame_count += 1
+    
+    def getLastFrameTime( self ) :
+        if not self.frame_count :
+            return 0.0
+        return self.times[ ( self.frame_count - 1 ) % len( self.times ), -1 ]
+    
+    def getHistory( self ) :
+        """
+        Returns the recorded frame numbers and times, oldest first.
+        """
+        count = min( self.frame_count, len( self.times ) )
+        rows = ( np.arange( self.frame_count - count, self.frame_count ) ) % len( self.times )
+        return self.frame_numbers[ rows ], self.times[ rows ]
+    
+    def getSummary( self, last=None ) :
+        """
+        Returns mean and 95th percentile milliseconds per stage and for the
+        whole frame over the last frames (all of the history by default).
+        """
+        frameNumbers, times = self.getHistory()
+        if last :
+            times = times[ -last: ]
+        if not len( times ) :
+            return {}
+        summary = {}
+        for i, name in enumerate( self.stages + [ 'frame' ] ) :
+            summary[ name ] = { 'mean_ms' : float( times[ :, i ].mean() * 1000.0 ),
+                                'p95_ms' : float( np.percentile( times[ :, i ], 95 ) * 1000.0 ) }
+        summary[ 'fps' ] = 1000.0 / max( summary[ 'frame' ][ 'mean_ms' ], 1e-6 )
+        return summary
+    
+    def getStatusLine( self, last=60 ) :
+        summary = self.getSummary( last )
+        if not summary :
+            return ""
+        stageTimes = [ "%s %.1f" % ( stage, summary[ stage ][ 'mean_ms' ] ) for stage in self.stages ]
+        return "%.1f fps  %.1fms  (%s)" % ( summary[ 'fps' ], summary[ 'frame' ][ 'mean_ms' ], ", ".join( stageTimes ) )
+    
+    def export( self, filename ) :
+        """
+        Writes the history as CSV, or as JSON with a summary for a .json filename.
+        """
+        frameNumbers, times = self.getHistory()
+        columns = [ stage + "_ms" for stage in self.stages ] + [ "frame_ms" ]
+        with open( filename, 'w' ) as exportFile :
+            if filename.lower().endswith( ".json" ) :
+                json.dump( { 'stages' : self.stages, 'summary' : self.getSummary(),
+                             'frames' : [ dict( [ ( 'frame', int( frameNumber ) ) ] +
+                                                [ ( c, float( t * 1000.0 ) ) for c, t in zip( columns, row ) ] )
+                                          for frameNumber, row in zip( frameNumbers, times ) ] },
+                           exportFile, indent=1 )
+            else :
+                exportFile.write( ",".join( [ "frame" ] + columns ) + "\n" )
+                for frameNumber, row in zip( frameNumbers, times ) :
+                    exportFile.write( ",".join( [ str( frameNumber ) ] + [ "%.4f" % ( t * 1000.0 ) for t in row ] ) + "\n" )
+
+def drawHud( text_lines, font ) :
+    """
+    Draws lines of text over the top left of the frame.
+    """
+    # pixel rectangles are textured like everything else, which would darken the text
+    glDisable( GL_TEXTURE_2D )
+    lineHeight = font.get_linesize()
+    for i, line in enumerate( text_lines ) :
+        textSurface = font.render( line, True, ( 255, 255, 255 ) )
+        textData = pygame.image.tostring( textSurface, "RGBA", True )
+        glWindowPos2i( 8, height - 8 - lineHeight * ( i + 1 ) )
+        glDrawPixels( textSurface.get_width(), textSurface.get_height(), GL_RGBA, GL_UNSIGNED_BYTE, textData )
+    glEnable( GL_TEXTURE_2D )
+
+#######################
+# SOFTWARE RENDERING
+#######################
+
+# A headless stand-in for drawFrame/drawPoly: the same rotated, scaled and hue
+# tinted quads are bilinearly sampled with numpy and added into a float image,
+# so frames can be rendered without a display or an OpenGL context.
+# Images are stored bottom row first, like the GL framebuffer and texture data.
+
+def loadTextureImage( texture_file, mipmaps=False, size=None ) :
+    """
+    Loads a texture file as a float32 ( height, width, 3 ) array in 0..1,
+    or with mipmaps=True as the getMipPyramid list of its mip levels. With
+    size it is scaled to size x size first, see scaleTextureData.
+    """
+    textureData = loadTextureData( texture_file )
+    if size :
+        textureData = scaleTextureData( textureData, size )
+    textureImage = textureData[ :, :, :3 ].astype( np.float32 ) / 255.0
+    if mipmaps :
+        return getMipPyramid( textureImage )
+    return textureImage
+
+def getPixelGrid( frame_width, frame_height, window=None ) :
+    """
+    Returns the eye space x and y of every pixel centre on the quad plane, as
+    set up by resizeGL and drawPoly, or of those in the pixel window
+    ( x, y, width, height ) of the frame only.
+    """
+    x0, y0, tileWidth, tileHeight = window or ( 0, 0, frame_width, frame_height )
+    focal = 1.0 / math.tan( math.radians( fieldOfView ) / 2.0 )
+    aspect = float( frame_width ) / max( 1, frame_height )
+    ndc_x = ( np.arange( x0, x0 + tileWidth, dtype=np.float32 ) + 0.5 ) / frame_width * 2.0 - 1.0
+    ndc_y = ( np.arange( y0, y0 + tileHeight, dtype=np.float32 ) + 0.5 ) / frame_height * 2.0 - 1.0
+    eye_x = ndc_x * ( polyDepth * aspect / focal )
+    eye_y = ndc_y * ( polyDepth / focal )
+    return np.meshgrid( eye_x, eye_y )
+
+def getMipPyramid( texture_image ) :
+    """
+    Returns the mip levels of a texture image, full size first, each a 2x2
+    box filtered half of the one before, down to 1x1.
+    """
+    levels = [ texture_image ]
+    while max( levels[ -1 ].shape[ :2 ] ) > 1 :
+        level = levels[ -1 ]
+        # repeat the last row/column of odd sizes so every texel has a 2x2 block
+        if level.shape[0] % 2 :
+            level = np.concatenate( [ level, level[ -1: ] ], axis=0 )
+        if level.shape[1] % 2 :
+            level = np.concatenate( [ level, level[ :, -1: ] ], axis=1 )
+        levels.append( ( level[ 0::2, 0::2 ] + level[ 1::2, 0::2 ] +
+                         level[ 0::2, 1::2 ] + level[ 1::2, 1::2 ] ) * 0.25 )
+    return levels
+
+def sampleTextureBilinear( texture_image, u, v ) :
+    """
+    Bilinearly samples texture_image at texture coordinates u, v with
+    GL_REPEAT wrapping, like the GL_LINEAR textures from loadTextureGL.
+    """
+    texHeight, texWidth = texture_image.shape[ :2 ]
+    s = u * texWidth - 0.5
+    t = v * texHeight - 0.5
+    s0 = np.floor( s )
+    t0 = np.floor( t )
+    fs = ( s - s0 )[ ..., None ]
+    ft = ( t - t0 )[ ..., None ]
+    x0 = s0.astype( np.intp ) % texWidth
+    y0 = t0.astype( np.intp ) % texHeight
+    x1 = ( x0 + 1 ) % texWidth
+    y1 = ( y0 + 1 ) % texHeight
+    bottom = texture_image[ y0, x0 ] * ( 1.0 - fs ) + texture_image[ y0, x1 ] * fs
+    top = texture_image[ y1, x0 ] * ( 1.0 - fs ) + texture_image[ y1, x1 ] * fs
+    return bottom * ( 1.0 - ft ) + top * ft
+
+def sampleTextureMipmapped( mip_pyramid, u, v, lod ) :
+    """
+    Samples a getMipPyramid pyramid like GL_LINEAR_MIPMAP_LINEAR, blending
+    the two levels either side of lod.
+    """
+    lod = min( max( lod, 0.0 ), len( mip_pyramid ) - 1.0 )
+    level = int( lod )
+    texels = sampleTextureBilinear( mip_pyramid[ level ], u, v )
+    blend = lod - level
+    if blend > 0.0 :
+        texels = texels * ( 1.0 - blend ) + sampleTextureBilinear( mip_pyramid[ level + 1 ], u, v ) * blend
+    return texels
+
+# noinspection PyShadowingNames
+def drawPolySoftware( image, pixel_grid, texture_image, frame_number, alpha, offset,
+                      hue_freq, scale_freq, offset_freq, rot_freq ) :
+    """
+    Adds one quad into image, blended like glBlendFunc( GL_SRC_ALPHA, GL_ONE ).
+    """
+    zrot, hueramp, poly_size = getPolyTransform( frame_number, hue_freq, scale_freq, rot_freq )
+    drawQuadSoftware( image, pixel_grid, texture_image, zrot, hueramp, poly_size, alpha, offset )
+
+def drawQuadSoftware( image, pixel_grid, texture_image, zrot, hueramp, poly_size, alpha, offset ) :
+    """
+    Software drawQuad, adds the quad into image. hueramp may hold one colour
+    per three channels of image, each tinting the texels added into those.
+    """
+    if poly_size == 0.0 :
+        return
+    
+    eye_x, eye_y = pixel_grid
+    cos_angle = math.cos( math.radians( zrot ) )
+    sin_angle = math.sin( math.radians( zrot ) )
+    
+    # screen bounding box of the quad, to avoid sampling the whole frame
+    extent = abs( poly_size ) * math.sqrt( 2.0 )
+    centre = rotate2d( offset, math.radians( zrot ) )
+    xs = eye_x[ 0 ]
+    ys = eye_y[ :, 0 ]
+    x0, x1 = np.searchsorted( xs, [ centre[0] - extent, centre[0] + extent ] )
+    y0, y1 = np.searchsorted( ys, [ centre[1] - extent, centre[1] + extent ] )
+    if x0 >= x1 or y0 >= y1 :
+        return
+    
+    px = eye_x[ y0:y1, x0:x1 ]
+    py = eye_y[ y0:y1, x0:x1 ]
+    
+    # undo the glRotatef, then invert the quad's vertex to texcoord mapping
+    qx = px * cos_angle + py * sin_angle
+    qy = py * cos_angle - px * sin_angle
+    u = ( 1.0 - ( qx - offset[0] ) / poly_size ) * 0.5
+    v = ( 1.0 - ( qy - offset[1] ) / poly_size ) * 0.5
+    inside = ( u >= 0.0 ) & ( u < 1.0 ) & ( v >= 0.0 ) & ( v < 1.0 )
+    if not inside.any() :
+        return
+    
+    tint = np.asarray( hueramp, dtype=np.float32 ) * np.float32( alpha )
+    if isinstance( texture_image, list ) :
+        # a mip pyramid: the quad is flat on to the camera, so one level of
+        # detail from its texels per pixel covers all of it
+        pixelSize = xs[1] - xs[0] if len( xs ) > 1 else 1.0
+        texelsPerPixel = max( texture_image[0].shape[ :2 ] ) * pixelSize / ( 2.0 * abs( poly_size ) )
+        lod = math.log( max( texelsPerPixel, 1e-6 ), 2 )
+        texels = sampleTextureMipmapped( texture_image, u[ inside ], v[ inside ], lod )
+    else :
+        texels = sampleTextureBilinear( texture_image, u[ inside ], v[ inside ] )
+    if len( tint ) > texels.shape[ -1 ] :
+        # several tints, each added into its own three channels of image
+        texels = np.tile( texels, len( tint ) // texels.shape[ -1 ] )
+    image[ y0:y1, x0:x1 ][ inside ] += texels * tint
+
+# noinspection PyShadowingNames
+def drawFrameSoftware( texture_image, frame_number, freq, shutter_length, shutter_fade_width,
+                       shutter_steps, shutter_sum, exposure, offset, hue_freq, scale_freq,
+                       offset_freq, rotfreq, offset_wave_amps, offset_wave_freqs,
+                       frame_width=width, frame_height=height, window=None, sample_range=None ) :
+    """
+    Renders the same frame as drawFrame on the CPU, returning a float32
+    ( frame_height, frame_width, 3 ) image, or just the pixel window
+    ( x, y, width, height ) of it. texture_image is an image from
+    loadTextureImage, or a getMipPyramid list of them for mipmapped sampling.
+    With sample_range ( start, stop ) only those shutter samples are drawn,
+    so that partial images of the samples can be rendered apart and summed.
+    """
+    pixel_grid = getPixelGrid( frame_width, frame_height, window )
+    image = np.zeros( pixel_grid[0].shape + ( 3, ), dtype=np.float32 )
+    
+    samples = getShutterSamples( frame_number, freq, shutter_length, shutter_fade_width,
+                                 shutter_steps, shutter_sum, exposure, offset, hue_freq,
+                                 scale_freq, offset_freq, rotfreq, offset_wave_amps,
+                                 offset_wave_freqs )
+    
+    for i in range( *( sample_range or ( shutter_steps, ) ) ) :
+        drawQuadSoftware( image, pixel_grid, texture_image, samples.zrot[ i ], samples.hue[ i ],
+                          samples.poly_size[ i ], samples.alpha[ i ], samples.offset[ i ] )
+    
+    return image
+
+def renderFrameSoftware( texture_image, frame_number, parameters,
+                         frame_width=width, frame_height=height, window=None, sample_range=None ) :
+    """
+    Renders frame_number, or a pixel window of it, with drawFrameSoftware,
+    taking the animation parameters from a dict like defaultParameters.
+    With sample_range only those shutter samples are drawn, weighted by their
+    shutter weight alone: the partial images of all the samples, summed and
+    scaled by exposure / getShutterSum, make the frame.
+    """
+    p = parameters
+    if sample_range is None :
+        shutter_sum = getShutterSum( p[ 'shutter_samples' ], p[ 'shutter_fade_width' ] )
+        exposure = p[ 'exposure' ]
+    else :
+        shutter_sum = exposure = 1.0
+    return drawFrameSoftware( texture_image, frame_number, p[ 'freq' ], p[ 'shutter_length' ],
+                              p[ 'shutter_fade_width' ], p[ 'shutter_samples' ], shutter_sum,
+                              exposure, p[ 'offset' ], p[ 'hue_freq' ], p[ 'scale_freq' ],
+                              p[ 'offset_freq' ], p[ 'rot_freq' ], p[ 'offset_wave_amps' ],
+                              p[ 'offset_wave_freqs' ], frame_width, frame_height, window, sample_range )
+
+def imageToPixels( image, dtype=np.uint8 ) :
+    """
+    Converts a float image from drawFrameSoftware or toneMapImage into the
+    RGBA pixels, bottom row first, that frame sinks take. uint8 and uint16
+    pixels are clipped to 0..1 and quantized, float32 ones are left linear.
+    """
+    dtype = np.dtype( dtype )
+    pixels = np.empty( image.shape[ :2 ] + ( 4, ), dtype=dtype )
+    if dtype.kind == 'f' :
+        pixels[ :, :, :3 ] = image
+        pixels[ :, :, 3 ] = 1.0
+    else :
+        whitePoint = np.iinfo( dtype ).max
+        pixels[ :, :, :3 ] = np.clip( image * float( whitePoint ) + 0.5, 0, whitePoint )
+        pixels[ :, :, 3 ] = whitePoint
+    return pixels
+
+def imageToSurface( image ) :
+    """
+    Converts a float image from drawFrameSoftware into a pygame Surface, so it
+    can be passed to writeFrame.
+    """
+    pixels = imageToPixels( image )[ ::-1 ]
+    return pygame.image.frombuffer( pixels.tobytes(), ( pixels.shape[1], pixels.shape[0] ), "RGBA" )
+
+#######################
+# SUB-FRAME ACCUMULATION
+#######################
+
+# Consecutive frames' shutters overlap: each covers shutter_length of sample
+# time centred on frame_number * freq, and moves on by only freq a frame.
+# In accumulation mode the samples sit on one fixed lattice of sample times,
+# k * shutter_length / ( shutter_samples - 1 ), and each run of segment_size
+# lattice samples is drawn once into a cached segment. A frame is a weighted
+# sum of the segments under its shutter, so only the segments coming under it
+# are drawn: about freq / lattice step samples a frame, not shutter_samples.
+#
+# A segment holds two images, its samples weighted by a ramp down and by a ramp
+# up across the segment. Blending them by the getShutter weights at the
+# segment's two ends gives the shutter profile interpolated linearly between
+# segment boundaries, with no negative weights, so GL can composite the
+# segments with additive blending.
+#
+# The offset wave depends on frame number plus shutter offset, which no lattice
+# can share between frames, so here it is evaluated at sample time / freq:
+# the same as drawFrame at the centre of the shutter, but moving 1 / freq
+# times faster across it. The offset is applied before each sample's own
+# rotation, so it cannot be put right by moving the composited frame either.
+# Accumulation is therefore an approximation, only matching drawFrame with
+# the offset wave amplitudes at zero, and is never on by default.
+
+# noinspection PyShadowingNames
+def getSubframeSamples( first_sample, count, lattice_step, freq, offset, hue_freq, scale_freq,
+                        rotfreq, offset_wave_amps, offset_wave_freqs ) :
+    """
+    Returns the ShutterSamples of count lattice samples from first_sample,
+    with weight holding each one's place on the ramp across them (0 up to
+    1 - 1 / count) and alpha 1 / count.
+    """
+    sample_frames = np.arange( first_sample, first_sample + count ) * lattice_step
+    
+    wave_time = sample_frames / freq
+    offsets = np.empty( ( count, 2 ) )
+    offsets[ :, 0 ] = offset[0] + np.sin( wave_time * offset_wave_freqs[ 0 ] ) * offset_wave_amps[ 0 ]
+    offsets[ :, 1 ] = offset[1] + np.cos( wave_time * offset_wave_freqs[ 1 ] ) * offset_wave_amps[ 0 ]
+    
+    zrot, hueramp, poly_size = getPolyTransforms( sample_frames, hue_freq * freq,
+                                                  scale_freq * freq, rotfreq * freq )
+    ramp = np.arange( count, dtype=np.float64 ) / count
+    return ShutterSamples( ramp, np.full( count, 1.0 / count ), sample_frames,
+                           offsets, zrot, hueramp, poly_size )
+
+class SubframeAccumulator( object ) :
+    """
+    Renders frames as weighted sums of cached shutter segments, drawing only
+    the segments that have come under the shutter since they were last used.
+    backend, a SoftwareSubframes or GLSubframes, draws and blends the segments.
+    """
+    def __init__( self, backend, segments_per_window=subframeSegments ) :
+        self.backend = backend
+        self.segments_per_window = segments_per_window
+        # segment index -> backend segment, least recently used first
+        self.segments = collections.OrderedDict()
+        self.key = None
+        self.texture = None
+        self.drawn_samples = 0
+        self.last_drawn_samples = 0
+    
+    def clear( self ) :
+        for segment in self.segments.values() :
+            self.backend.release( segment )
+        self.segments.clear()
+    
+    # noinspection PyShadowingNames
+    def render( self, texture, frame_number, freq, shutter_length, shutter_fade_width,
+                shutter_steps, exposure, offset, hue_freq, scale_freq, offset_freq, rotfreq,
+                offset_wave_amps, offset_wave_freqs, profiler=None ) :
+        """
+        Renders frame_number, taking drawFrame's arguments less shutter_sum,
+        which comes from the segment weights. Returns what the backend's
+        composite does: the image for SoftwareSubframes, None for GLSubframes.
+        """
+        if freq == 0 or shutter_length <= 0 :
+            raise ValueError( "accumulation needs a moving shutter, freq and shutter_length are %g and %g"
+                              % ( freq, shutter_length ) )
+        
+        segment_size = max( 1, int( math.ceil( shutter_steps / float( self.segments_per_window ) ) ) )
+        lattice_step = shutter_length / max( 1, shutter_steps - 1 )
+        
+        # everything the segment images depend on; exposure and the fade do not
+        textureKey = texture if np.isscalar( texture ) else id( texture )
+        key = ( textureKey, freq, lattice_step, segment_size, tuple( offset ), hue_freq, scale_freq,
+                rotfreq, tuple( offset_wave_amps ), tuple( offset_wave_freqs ) )
+        if key != self.key :
+            self.clear()
+            self.key = key
+            # held so an id() key cannot be reused by another texture
+            self.texture = texture
+        
+        # getShutter weights at the boundaries of the segments under the shutter
+        shutter_start = frame_number * freq - shutter_length * 0.5
+        segment_length = segment_size * lattice_step
+        first = int( math.floor( shutter_start / segment_length ) )
+        last = int( math.floor( ( shutter_start + shutter_length ) / segment_length ) )
+        positions = ( np.arange( first, last + 2 ) * segment_length - shutter_start ) / shutter_length
+        boundary_weights = np.where( ( positions >= 0.0 ) & ( positions <= 1.0 ),
+                                     getShutterWeights( positions, shutter_fade_width ), 0.0 )
+        
+        # the sum of every sample's interpolated weight, as getShutterSum
+        shutter_sum = ( boundary_weights[ :-1 ].sum() * ( segment_size + 1 ) +
+                        boundary_weights[ 1: ].sum() * ( segment_size - 1 ) ) * 0.5
+        # segment images hold means, so scale them back up to sums
+        scale = exposure * segment_size / shutter_sum
+        if profiler is not None :
+            profiler.mark( 'shutter' )
+        
+        weighted_segments = []
+        drawn = 0
+        for index in range( first, last + 1 ) :
+            segment = self.segments.get( index )
+            if segment is None :
+                samples = getSubframeSamples( index * segment_size, segment_size, lattice_step, freq,
+                                              offset, hue_freq, scale_freq, rotfreq,
+                                              offset_wave_amps, offset_wave_freqs )
+                segment = self.backend.drawSegment( texture, samples )
+                self.segments[ index ] = segment
+                drawn += segment_size
+            else :
+                self.segments.move_to_end( index )
+            weighted_segments.append( ( segment, boundary_weights[ index - first ] * scale,
+                                        boundary_weights[ index - first + 1 ] * scale ) )
+        
+        # keep a couple of spare segments, for when the shutter turns around
+        while len( self.segments ) > last - first + 3 :
+            self.backend.release( self.segments.popitem( last=False )[ 1 ] )
+        
+        self.drawn_samples += drawn
+        self.last_drawn_samples = drawn
+        result = self.backend.composite( weighted_segments )
+        if profiler is not None :
+            profiler.mark( 'submit' )
+        return result
+    
+    def close( self ) :
+        self.clear()
+        self.backend.close()
+
+def renderFrameAccumulated( accumulator, texture, frame_number, parameters ) :
+    """
+    Renders frame_number with a SubframeAccumulator, taking the animation
+    parameters from a dict like defaultParameters.
+    """
+    p = parameters
+    return accumulator.render( texture, frame_number, p[ 'freq' ], p[ 'shutter_length' ],
+                               p[ 'shutter_fade_width' ], p[ 'shutter_samples' ], p[ 'exposure' ],
+                               p[ 'offset' ], p[ 'hue_freq' ], p[ 'scale_freq' ], p[ 'offset_freq' ],
+                               p[ 'rot_freq' ], p[ 'offset_wave_amps' ], p[ 'offset_wave_freqs' ] )
+
+class SoftwareSubframes( object ) :
+    """
+    SubframeAccumulator backend drawing segments with drawQuadSoftware, each a
+    float32 ( height, width, 6 ) image of the ramp down and ramp up sums.
+    """
+    def __init__( self, frame_width=width, frame_height=height ) :
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.pixel_grid = getPixelGrid( frame_width, frame_height )
+    
+    def drawSegment( self, texture_image, samples ) :
+        segment = np.zeros( ( self.frame_height, self.frame_width, 6 ), dtype=np.float32 )
+        for i in range( len( samples.alpha ) ) :
+            ramp = samples.weight[ i ]
+            tints = np.concatenate( [ samples.hue[ i ] * ( 1.0 - ramp ), samples.hue[ i ] * ramp ] )
+            drawQuadSoftware( segment, self.pixel_grid, texture_image, samples.zrot[ i ], tints,
+                              samples.poly_size[ i ], samples.alpha[ i ], samples.offset[ i ] )
+        return segment
+    
+    def composite( self, weighted_segments ) :
+        image = np.zeros( ( self.frame_height, self.frame_width, 3 ), dtype=np.float32 )
+        for segment, down_scale, up_scale in weighted_segments :
+            image += segment[ :, :, :3 ] * np.float32( down_scale )
+            image += segment[ :, :, 3: ] * np.float32( up_scale )
+        return image
+    
+    def release( self, segment ) :
+        pass
+    
+    def close( self ) :
+        pass
+
+class GLSubframes( object ) :
+    """
+    SubframeAccumulator backend drawing segments with drawQuadBatch through a
+    framebuffer object, into a pair of half float textures per segment, and
+    compositing them into the framebuffer bound when rendering.
+    """
+    def __init__( self, frame_width=width, frame_height=height ) :
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.framebuffer = glGenFramebuffers( 1 )
+    
+    def drawSegment( self, texture, samples ) :
+        segment = np.atleast_1d( glGenTextures( 2 ) )
+        # frames may be being drawn into a FloatFramebuffer
+        drawFramebuffer = glGetIntegerv( GL_FRAMEBUFFER_BINDING )
+        glBindFramebuffer( GL_FRAMEBUFFER, self.framebuffer )
+        for rampTexture, alpha in zip( segment, ( samples.alpha * ( 1.0 - samples.weight ),
+                                                  samples.alpha * samples.weight ) ) :
+            glBindTexture( GL_TEXTURE_2D, rampTexture )
+            glTexParameteri( GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST )
+            glTexParameteri( GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST )
+            glTexImage2D( GL_TEXTURE_2D, 0, GL_RGBA16F, self.frame_width, self.frame_height, 0,
+                          GL_RGBA, GL_FLOAT, None )
+            glFramebufferTexture2D( GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, rampTexture, 0 )
+            
+            # alpha stays at 1, so it does not scale the segment when composited
+            glClearColor( 0.0, 0.0, 0.0, 1.0 )
+            glClear( GL_COLOR_BUFFER_BIT )
+            glClearColor( 0.0, 0.0, 0.0, 0.0 )
+            glColorMask( GL_TRUE, GL_TRUE, GL_TRUE, GL_FALSE )
+            glBindTexture( GL_TEXTURE_2D, texture )
+            drawQuadBatch( samples._replace( alpha=alpha ) )
+            glColorMask( GL_TRUE, GL_TRUE, GL_TRUE, GL_TRUE )
+        glBindFramebuffer( GL_FRAMEBUFFER, drawFramebuffer )
+        return segment
+    
+    def composite( self, weighted_segments ) :
+        glClear( GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT )
+        glMatrixMode( GL_PROJECTION )
+        glPushMatrix()
+        glLoadIdentity()
+        glMatrixMode( GL_MODELVIEW )
+        glLoadIdentity()
+        
+        for segment, down_scale, up_scale in weighted_segments :
+            for rampTexture, scale in zip( segment, ( down_scale, up_scale ) ) :
+                glBindTexture( GL_TEXTURE_2D, rampTexture )
+                # vertex colours are clamped to 1, so larger scales take more passes
+                passes = int( math.ceil( scale ) )
+                for i in range( passes ) :
+                    glBegin( GL_QUADS )
+                    glColor4f( 1.0, 1.0, 1.0, scale / passes )
+                    glTexCoord2f( 0.0, 0.0 ) ; glVertex2f( -1.0, -1.0 )
+                    glTexCoord2f( 1.0, 0.0 ) ; glVertex2f( 1.0, -1.0 )
+                    glTexCoord2f( 1.0, 1.0 ) ; glVertex2f( 1.0, 1.0 )
+                    glTexCoord2f( 0.0, 1.0 ) ; glVertex2f( -1.0, 1.0 )
+                    glEnd()
+        
+        glMatrixMode( GL_PROJECTION )
+        glPopMatrix()
+        glMatrixMode( GL_MODELVIEW )
+    
+    def release( self, segment ) :
+        glDeleteTextures( segment )
+    
+    def close( self ) :
+        glDeleteFramebuffers( 1, [ self.framebuffer ] )
+
+#######################
+# TILED RENDERING
+#######################
+
+# Frames bigger than the window, or than memory, are rendered a band of tiles
+# at a time, top band first. Each tile is the frame's frustum narrowed to its
+# pixels, drawn into an offscreen FloatFramebuffer with setTileProjection or in
+# software with a pixel window, and each finished band can go straight into a
+# PngStreamWriter, so memory is bounded by one band whatever the frame size.
+
+def iterTiledBands( render_tile, frame_width, frame_height, tile_size=1024 ) :
+    """
+    Yields the float32 ( rows, frame_width, 3 ) bands of a frame, top band
+    first and top row first, from render_tile( window ), which returns the
+    bottom row first image of the pixel window ( x, y, width, height ).
+    """
+    for bandTop in range( frame_height, 0, -tile_size ) :
+        bandBottom = max( 0, bandTop - tile_size )
+        band = np.empty( ( bandTop - bandBottom, frame_width, 3 ), dtype=np.float32 )
+        for x in range( 0, frame_width, tile_size ) :
+            tileWidth = min( tile_size, frame_width - x )
+            band[ :, x:x + tileWidth ] = render_tile( ( x, bandBottom, tileWidth, bandTop - bandBottom ) )
+        yield band[ ::-1 ]
+
+def setTileProjection( frame_width, frame_height, window ) :
+    """
+    Narrows resizeGL's projection of a frame_width x frame_height frame to its
+    pixel window ( x, y, width, height ), drawn at the viewport's origin.
+    """
+    x, y, tileWidth, tileHeight = window
+    # the near plane of resizeGL's gluPerspective
+    near = 0.1
+    top = near * math.tan( math.radians( fieldOfView ) / 2.0 )
+    right = top * frame_width / float( frame_height )
+    glViewport( 0, 0, tileWidth, tileHeight )
+    glMatrixMode( GL_PROJECTION )
+    glLoadIdentity()
+    glFrustum( right * ( 2.0 * x / frame_width - 1.0 ), right * ( 2.0 * ( x + tileWidth ) / frame_width - 1.0 ),
+               top * ( 2.0 * y / frame_height - 1.0 ), top * ( 2.0 * ( y + tileHeight ) / frame_height - 1.0 ),
+               near, 100.0 )
+    glMatrixMode( GL_MODELVIEW )
+
+def renderTileGL( float_buffer, texture, frame_number, parameters, frame_width, frame_height, window ) :
+    """
+    Draws the pixel window of frame_number with drawFrame into float_buffer,
+    which must be at least the window's size, and returns it as a float image.
+    """
+    p = parameters
+    setTileProjection( frame_width, frame_height, window )
+    float_buffer.bind()
+    drawFrame( texture, frame_number, p[ 'freq' ], p[ 'shutter_length' ], p[ 'shutter_fade_width' ],
+               p[ 'shutter_samples' ], getShutterSum( p[ 'shutter_samples' ], p[ 'shutter_fade_width' ] ),
+               p[ 'exposure' ], p[ 'offset' ], p[ 'hue_freq' ], p[ 'scale_freq' ], p[ 'offset_freq' ],
+               p[ 'rot_freq' ], p[ 'offset_wave_amps' ], p[ 'offset_wave_freqs' ], flip=False )
+    glBindFramebuffer( GL_FRAMEBUFFER, 0 )
+    return float_buffer.readImage()[ :window[3], :window[2] ]
+
+#######################
+# CONTACT SHEETS
+#######################
+
+# A contact sheet draws one frame for many textures, or for many parameter
+# sets, side by side in a grid of cells with the frame's aspect. On GL every
+# texture is scaled into a cell of one atlas texture, so the whole sheet is
+# drawn with a single texture bind and one batched draw per cell, through a
+# viewport the size of the cell.
+
+def scaleTextureData( texture_data, size ) :
+    """
+    Returns loadTextureData RGBX texture data smoothly scaled to size x size.
+    """
+    textureData = np.ascontiguousarray( texture_data )
+    surface = pygame.image.frombuffer( textureData.tobytes(), ( textureData.shape[1], textureData.shape[0] ), "RGBX" )
+    scaled = pygame.transform.smoothscale( surface, ( size, size ) )
+    scaledData = np.frombuffer( pygame.image.tostring( scaled, "RGBX" ), dtype=np.uint8 ).reshape( size, size, 4 )
+    # smoothscale filters the padding byte too, but GL_MODULATE multiplies by it
+    scaledData = scaledData.copy()
+    scaledData[ :, :, 3 ] = 255
+    return scaledData
+
+def getSheetWindows( count, frame_width, frame_height ) :
+    """
+    Returns the pixel windows ( x, y, width, height ) of count cells in a
+    square grid over the frame, left to right from the top row down.
+    """
+    columns = max( 1, int( math.ceil( math.sqrt( count ) ) ) )
+    rows = max( 1, int( math.ceil( count / float( columns ) ) ) )
+    windows = []
+    for i in range( count ) :
+        column, row = i % columns, i // columns
+        x0, x1 = column * frame_width // columns, ( column + 1 ) * frame_width // columns
+        # rows count down from the top, pixels up from the bottom
+        y0, y1 = frame_height - ( row + 1 ) * frame_height // rows, frame_height - row * frame_height // rows
+        windows.append( ( x0, y0, x1 - x0, y1 - y0 ) )
+    return windows
+
+def buildTextureAtlas( texture_files, cell_size=atlasCellSize, gutter=atlasGutter ) :
+    """
+    Scales every texture into a cell of one RGBX atlas, bottom row first like
+    loadTextureData, and returns it with each texture's ( s0, t0, s1, t1 ).
+    """
+    stride = cell_size + 2 * gutter
+    columns = max( 1, int( math.ceil( math.sqrt( len( texture_files ) ) ) ) )
+    rows = max( 1, int( math.ceil( len( texture_files ) / float( columns ) ) ) )
+    atlas = np.zeros( ( rows * stride, columns * stride, 4 ), dtype=np.uint8 )
+    texRects = []
+    for i, textureFile in enumerate( texture_files ) :
+        x, y = ( i % columns ) * stride, ( i // columns ) * stride
+        cell = scaleTextureData( loadTextureData( textureFile ), cell_size )
+        atlas[ y:y + stride, x:x + stride ] = np.pad( cell, ( ( gutter, gutter ), ( gutter, gutter ), ( 0, 0 ) ),
+                                                      mode='edge' )
+        texRects.append( ( ( x + gutter ) / float( atlas.shape[1] ), ( y + gutter ) / float( atlas.shape[0] ),
+                           ( x + gutter + cell_size ) / float( atlas.shape[1] ),
+                           ( y + gutter + cell_size ) / float( atlas.shape[0] ) ) )
+    return atlas, texRects
+
+def loadTextureAtlasGL( texture_files, cell_size=atlasCellSize, gutter=atlasGutter ) :
+    """
+    Uploads buildTextureAtlas's atlas, returning the GL texture and texture rects.
+    """
+    atlas, texRects = buildTextureAtlas( texture_files, cell_size, gutter )
+    atlasTexture = glGenTextures( 1 )
+    uploadTexture( atlasTexture, atlas, mipmaps=True )
+    glTexParameteri( GL_TEXTURE_2D, GL_TEXTURE_MAX_LEVEL, max( 0, int( math.log( max( 1, gutter ), 2 ) ) ) )
+    return atlasTexture, texRects
+
+def drawContactSheet( atlas_texture, tex_rects, cell_parameters, frame_number, frame_width, frame_height,
+                      samples=None ) :
+    """
+    Draws frame_number for each pair of atlas tex_rects and parameter dicts
+    like defaultParameters into the cells of getSheetWindows, with samples
+    shutter samples if given, and leaves resizeGL's viewport set again.
+    """
+    glClear( GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT )
+    glBindTexture( GL_TEXTURE_2D, atlas_texture )
+    windows = getSheetWindows( len( cell_parameters ), frame_width, frame_height )
+    for window, texRect, p in zip( windows, tex_rects, cell_parameters ) :
+        cellSamples = samples or p[ 'shutter_samples' ]
+        x, y, cellWidth, cellHeight = window
+        glViewport( x, y, cellWidth, cellHeight )
+        glMatrixMode( GL_PROJECTION )
+        glLoadIdentity()
+        gluPerspective( fieldOfView, cellWidth / float( max( 1, cellHeight ) ), 0.1, 100.0 )
+        glMatrixMode( GL_MODELVIEW )
+        drawQuadBatch( getShutterSamples( frame_number, p[ 'freq' ], p[ 'shutter_length' ],
+                                          p[ 'shutter_fade_width' ], cellSamples,
+                                          getShutterSum( cellSamples, p[ 'shutter_fade_width' ] ),
+                                          p[ 'exposure' ], p[ 'offset' ], p[ 'hue_freq' ], p[ 'scale_freq' ],
+                                          p[ 'offset_freq' ], p[ 'rot_freq' ], p[ 'offset_wave_amps' ],
+                                          p[ 'offset_wave_freqs' ] ), texRect )
+    resizeGL( frame_width, frame_height )
+
+def renderContactSheetSoftware( cell_textures, cell_parameters, frame_number, frame_width, frame_height ) :
+    """
+    The software drawContactSheet: renders frame_number with each pair of
+    texture images and parameter dicts into its cell of a float image.
+    """
+    image = np.zeros( ( frame_height, frame_width, 3 ), dtype=np.float32 )
+    windows = getSheetWindows( len( cell_parameters ), frame_width, frame_height )
+    for window, textureImage, parameters in zip( windows, cell_textures, cell_parameters ) :
+        x, y, cellWidth, cellHeight = window
+        image[ y:y + cellHeight, x:x + cellWidth ] = renderFrameSoftware( textureImage, frame_number, parameters,
+                                                                         cellWidth, cellHeight )
+    return image
+
 #######################
 # UTILITY FUNCTIONS
 #######################
@@ -249,7 +2504,7 @@ def resizeGL( scrWidth, scrHeight ) :
     glViewport( 0, 0, scrWidth, scrHeight )
     glMatrixMode( GL_PROJECTION )
     glLoadIdentity()
-    gluPerspective( 45, 1.0 * scrWidth / scrHeight, 0.1, 100.0 )
+    gluPerspective( fieldOfView, 1.0 * scrWidth / scrHeight, 0.1, 100.0 )
     glMatrixMode( GL_MODELVIEW )
     glLoadIdentity()
 
@@ -268,12 +2523,27 @@ def initGL() :
     glEnable( GL_BLEND )
     glBlendFunc( GL_SRC_ALPHA, GL_ONE )
     
+    # buffers belong to the context, so a new one is needed if set_mode replaced it
+    global quadVertexBuffer
+    if quadVertexBuffer is None or not glIsBuffer( quadVertexBuffer ) :
+        quadVertexBuffer = glGenBuffers( 1 )
+    
 #######################
 # MAIN
 #######################
 if __name__ == '__main__' :
 
+    if openGLError is not None :
+        sys.exit( "The viewer needs OpenGL, which could not be loaded: %s\n"
+                  "glimmera_render.py renders without it." % openGLError )
+
+    start_time = time.time()
     verbose = False
+    # per-stage timings: F3 toggles the on screen display, and with
+    # GLIMMERA_PROFILE=timings.csv (or .json) set the last frames' timings
+    # are written there on exit
+    show_hud = False
+    profile_file = os.environ.get( 'GLIMMERA_PROFILE' )
 
     # get tex names
     texpath = "textures/"
@@ -293,7 +2563,9 @@ if __name__ == '__main__' :
     video_flags = OPENGL | DOUBLEBUF
     video_flags_fullscreen = video_flags | FULLSCREEN
     
-    pygame.init()
+    # only the display: the HUD starts the font module when it is first shown,
+    # and audio and joysticks, which pygame.init() would start, are unused
+    pygame.display.init()
     
     # turn ON ANTIALIASING! :D
     pygame.display.gl_set_attribute( pygame.locals.GL_MULTISAMPLEBUFFERS, 1 )
@@ -309,7 +2581,7 @@ if __name__ == '__main__' :
     resizeGL( width, height )
     
     initGL()
-    textures = loadTextureGL( txlist )
+    textures = TextureManager( txlist )
     
     # tell the user how many frames are going to be rendered
     # print( "rendering %d frames ..." % frames )
@@ -320,53 +2592,183 @@ if __name__ == '__main__' :
     
     done = False
     recording = False
+    recorder = None
+    sink = None
     frame_number = 0
     recorded_frame_number = 0
 
-    selected_tex = 0
-    shutter_samples = 260
-    shutter_length = 8.0
-    exposure = 1.5
-    offset = [ -0.57, 1.08 ]
-    offset_wave_amps = [ 0.4, 0.6 ]
-    offset_wave_freqs = [ 0.027, 0.013 ]
-    freq = 0.115
-    hueFreq = 0.4
+    # everything the key and mouse handlers change, see Parameters
+    params = Parameters()
+    timeline = None
     # phasepeed is in seconds
     phase_speed = 0.8
-    offset_freq = 0.00633
-    scale_freq = 114.0
-    rot_freq = 2.536
-    shutter_sum = getShutterSum( shutter_samples, 0.5 )
-    last_time = time.time( )
+    profiler = FrameProfiler()
+    adaptive = False
+    sampler = AdaptiveSampler()
+    last_input_time = time.time()
+    live_samples = params.shutter_samples
+    # T toggles drawing frames from cached shutter segments, see SubframeAccumulator
+    accumulate = False
+    accumulator = None
+    accumulated_tex = None
+    # S toggles drawing frames in one shader pass, see drawFrameShader
+    use_shader = False
+    # F toggles drawing into a FloatFramebuffer, M steps through the tone maps
+    use_float = False
+    float_buffer = None
+    # P toggles drawing into a small proxy_buffer while there is input
+    use_proxy = False
+    proxy_buffer = None
+    # C toggles a contact sheet of every texture, clicking a cell selects it
+    show_sheet = False
+    sheet_atlas = None
+    sheet_rects = None
+    hud_font = None
+    hud_text = []
     
     while not done :
         # draw frame
+        profiler.startFrame()
         
-        stex = selected_tex % len( textures )
+        stex = params.texture % len( textures )
         if stex < 0 :
             stex = len( textures ) - 1
+        if timeline is not None :
+            timeline.log( frame_number, params )
+        
+        texture = textures.get( stex )
+        profiler.mark( 'texture' )
         
-        texture = textures[ stex ]
-        drawFrame( texture, frame_number, freq, shutter_length, 0.5,
-                   shutter_samples, shutter_sum, exposure, offset,
-                   hueFreq, scale_freq, offset_freq, rot_freq,
-                   offset_wave_amps, offset_wave_freqs )
+        # recorded frames are never proxies
+        proxying = use_proxy and not recording and time.time() - last_input_time < proxyIdleDelay
+        if proxying and proxy_buffer is None :
+            try :
+                proxy_buffer = FloatFramebuffer( max( 1, width // proxyScale ), max( 1, height // proxyScale ),
+                                                 smooth=True )
+            except RuntimeError as e :
+                print( "Interaction proxy unavailable: " + str( e ) )
+                use_proxy = proxying = False
+        if use_float and float_buffer is None :
+            try :
+                float_buffer = FloatFramebuffer( width, height )
+            except RuntimeError as e :
+                print( "Float accumulation unavailable: " + str( e ) )
+                use_float = False
+        draw_width, draw_height = width, height
+        if proxying :
+            proxy_buffer.bind()
+            draw_width, draw_height = proxy_buffer.frame_width, proxy_buffer.frame_height
+            resizeGL( draw_width, draw_height )
+            draw_exposure = 1.0
+        elif use_float :
+            float_buffer.bind()
+            # applied by the resolve instead
+            draw_exposure = 1.0
+        else :
+            draw_exposure = params.exposure
+        
+        if show_sheet :
+            if sheet_atlas is None :
+                sheet_atlas, sheet_rects = loadTextureAtlasGL( txlist )
+            if adaptive and not recording :
+                live_samples = sampler.getSamples( params.shutter_samples,
+                                                   time.time() - last_input_time > sampler.idle_delay )
+            else :
+                live_samples = params.shutter_samples
+            if proxying :
+                live_samples = max( 1, live_samples // proxySampleDivisor )
+            sheetParameters = dict( params.toDict(), exposure=draw_exposure )
+            drawContactSheet( sheet_atlas, sheet_rects, [ sheetParameters ] * len( sheet_rects ), frame_number,
+                              draw_width, draw_height, live_samples )
+            profiler.mark( 'submit' )
+        # a still shutter has no segments to reuse, so it is drawn as usual
+        elif accumulate and params.freq != 0 and params.shutter_length > 0 and not proxying :
+            if accumulator is None :
+                accumulator = SubframeAccumulator( GLSubframes( width, height ) )
+            # texture names are reused once evicted, so they cannot key the cache
+            if stex != accumulated_tex :
+                accumulator.clear()
+                accumulated_tex = stex
+            accumulator.render( texture, frame_number, params.freq, params.shutter_length,
+                                params.shutter_fade_width, params.shutter_samples, draw_exposure,
+                                params.offset, params.hue_freq, params.scale_freq, params.offset_freq,
+                                params.rot_freq, params.offset_wave_amps, params.offset_wave_freqs,
+                                profiler=profiler )
+            live_samples = accumulator.last_drawn_samples
+        else :
+            # recorded frames always get the full sample count
+            if adaptive and not recording :
+                live_samples = sampler.getSamples( params.shutter_samples,
+                                                   time.time() - last_input_time > sampler.idle_delay )
+            else :
+                live_samples = params.shutter_samples
+            if proxying :
+                live_samples = max( 1, live_samples // proxySampleDivisor )
+            live_sum = getShutterSum( live_samples, params.shutter_fade_width )
+            
+            if use_shader :
+                try :
+                    drawFrameShader( texture, frame_number, params.freq, params.shutter_length,
+                                     params.shutter_fade_width, live_samples, live_sum, draw_exposure,
+                                     params.offset, params.hue_freq, params.scale_freq, params.offset_freq,
+                                     params.rot_freq, params.offset_wave_amps, params.offset_wave_freqs,
+                                     flip=False, profiler=profiler )
+                except RuntimeError as e :
+                    print( "Shader mode unavailable: " + str( e ) )
+                    use_shader = False
+            if not use_shader :
+                drawFrame( texture, frame_number, params.freq, params.shutter_length,
+                           params.shutter_fade_width, live_samples, live_sum, draw_exposure,
+                           params.offset, params.hue_freq, params.scale_freq, params.offset_freq,
+                           params.rot_freq, params.offset_wave_amps, params.offset_wave_freqs,
+                           flip=False, profiler=profiler )
+        
+        if proxying :
+            resizeGL( width, height )
+            proxy_buffer.resolve( params.exposure, params.tone_map )
+        elif use_float :
+            float_buffer.resolve( params.exposure, params.tone_map )
 
         frame_number += 1
-        # save frame
+        # save frame, read back from the back buffer before it is flipped
         if recording:
+            if recorder is None :
+                # the sink stays open across recording toggles, so streams continue
+                if sink is None :
+                    sink = makeFrameSink( recordSink, recordOutput )
+                recorder = FrameRecorder( width, height, sink )
             print( "Saving frame: " + str( recorded_frame_number ) )
-            writeFrame( screen, recorded_frame_number )
+            recorder.capture( recorded_frame_number )
             recorded_frame_number += 1
+            if verbose :
+                print( "Recorder: " + str( recorder.getStats() ) )
+        
+        # drawn after the recorder has read the frame, so it is not saved
+        if show_hud :
+            if hud_font is None :
+                pygame.font.init()
+                hud_font = pygame.font.Font( None, 24 )
+            if frame_number % 15 == 1 or not hud_text :
+                hud_text = [ profiler.getStatusLine(),
+                             "samples %d / %d%s  texture %d" % ( live_samples, params.shutter_samples,
+                                                                 "  sheet" if show_sheet else
+                                                                 "  accumulating" if accumulate else
+                                                                 "  shader" if use_shader else "", stex ) +
+                             ( "  adaptive" if adaptive else "" ) +
+                             ( "  proxy" if proxying else "" ) +
+                             ( "  float %s" % params.tone_map if use_float else "" ) ]
+            drawHud( hud_text, hud_font )
+        profiler.mark( 'record' )
+        
+        pygame.display.flip()
+        profiler.mark( 'flip' )
+        if verbose and frame_number == 1 :
+            print( "First frame after %.2fs" % ( time.time() - start_time ) )
         # pause before next frame
         # time.sleep(0.1)
         
-        newTime = time.time()
-        timeDiff = (newTime - last_time)
-        # if verbose :
-        #   print( "FPS:" + str( 1.0 / timeDiff ) )
-        last_time = newTime
+        if verbose and frame_number % 60 == 0 :
+            print( profiler.getStatusLine() )
         # Event Handling:
         events = pygame.event.get( )
 
@@ -377,118 +2779,115 @@ if __name__ == '__main__' :
                 done = True
                 break
             elif e.type == KEYDOWN:
+                last_input_time = time.time()
                 if e.key == K_RIGHT:
-                    selected_tex += 1
+                    params.texture += 1
                     if verbose :
-                        print( "Switched to next texture (number %d)" % selected_tex )
+                        print( "Switched to next texture (number %d)" % params.texture )
                 elif e.key == K_LEFT:
-                    selected_tex -= 1
+                    params.texture -= 1
                     if verbose :
-                        print( "Switched to previous texture (number %d)" % selected_tex )
+                        print( "Switched to previous texture (number %d)" % params.texture )
                     
                 elif e.key == K_PAGEUP :
                     if pygame.key.get_mods() & KMOD_CTRL :
-                        shutter_samples *= 2
+                        params.shutter_samples *= 2
                         if verbose :
-                            print( "Doubled shutter samples: " + str( shutter_samples ) )
+                            print( "Doubled shutter samples: " + str( params.shutter_samples ) )
                     else :
-                        shutter_samples += 1
+                        params.shutter_samples += 1
                         if verbose :
-                            print( "Increased shutter samples: " + str( shutter_samples ) )
-                    # recalc normalization
-                    shutter_sum = getShutterSum( shutter_samples, 0.5 )
+                            print( "Increased shutter samples: " + str( params.shutter_samples ) )
 
                 elif e.key == K_PAGEDOWN :
                     if pygame.key.get_mods() & KMOD_CTRL :
-                        shutter_samples /= 2
+                        params.shutter_samples //= 2
                     else :
-                        shutter_samples -= 1
-                    shutter_samples = max( 1, shutter_samples )
-                    shutter_sum = getShutterSum( shutter_samples, 0.5 )
+                        params.shutter_samples -= 1
+                    params.shutter_samples = max( 1, params.shutter_samples )
 
                     if verbose :
-                        print( "Reduced shutter samples: " + str( shutter_samples ) )
+                        print( "Reduced shutter samples: " + str( params.shutter_samples ) )
                     
-                    # recalc normalization
                 elif e.key == K_HOME :
                     if pygame.key.get_mods( ) & KMOD_CTRL :
-                        shutter_length *= 2.0
+                        params.shutter_length *= 2.0
                         if verbose :
-                            print( "Doubled shutter length: " + str( shutter_length ) )
+                            print( "Doubled shutter length: " + str( params.shutter_length ) )
                     else :
-                        shutter_length += 1.0
+                        params.shutter_length += 1.0
                         if verbose :
-                            print( "Incremented shutter length: " + str( shutter_length ) )
+                            print( "Incremented shutter length: " + str( params.shutter_length ) )
                     
                 elif e.key == K_END :
                     if pygame.key.get_mods( ) & KMOD_CTRL :
-                        shutter_length *= 0.5
+                        params.shutter_length *= 0.5
                         if verbose :
-                            print( "Halved shutter length: " + str( shutter_length ) )
+                            print( "Halved shutter length: " + str( params.shutter_length ) )
                     else :
-                        shutter_length -= 1.0
+                        params.shutter_length -= 1.0
                         if verbose :
-                            print( "Decremented shutter length: " + str( shutter_length ) )
+                            print( "Decremented shutter length: " + str( params.shutter_length ) )
                     
                 elif e.key == K_INSERT :
-                    exposure *= 1.1
+                    params.exposure *= 1.1
                     if verbose :
-                        print( "Exposure up to: " + str( exposure ) )
+                        print( "Exposure up to: " + str( params.exposure ) )
                     
                 elif e.key == K_DELETE :
-                    exposure *= 0.9
+                    params.exposure *= 0.9
                     if verbose :
-                        print( "Exposure down to: " + str( exposure ) )
+                        print( "Exposure down to: " + str( params.exposure ) )
                     
                 elif e.key == K_LEFTBRACKET :
-                    freq *= 0.8
+                    params.freq *= 0.8
                     if verbose :
-                        print( "Base frequency down to: " + str( freq ) )
+                        print( "Base frequency down to: " + str( params.freq ) )
                     
                 elif e.key == K_RIGHTBRACKET :
-                    freq *= 1.2
+                    params.freq *= 1.2
                     if verbose :
-                        print( "Base frequency up to: " + str( freq ) )
+                        print( "Base frequency up to: " + str( params.freq ) )
                 
                 elif e.key == K_COMMA :
-                    hueFreq *= 0.8
+                    params.hue_freq *= 0.8
                     if verbose :
-                        print( "Hue frequency down to: " + str( hueFreq ) )
+                        print( "Hue frequency down to: " + str( params.hue_freq ) )
                     
                 elif e.key == K_PERIOD :
-                    hueFreq *= 1.2
+                    params.hue_freq *= 1.2
                     if verbose :
-                        print( "Hue frequency up to: " + str( hueFreq ) )
+                        print( "Hue frequency up to: " + str( params.hue_freq ) )
                 
                 elif e.key == K_SEMICOLON:
-                    offset_freq *= 0.8
+                    params.offset_freq *= 0.8
                     if verbose :
-                        print( "Offset frequency down to: " + str( offset_freq ) )
+                        print( "Offset frequency down to: " + str( params.offset_freq ) )
                     
                 elif e.key == K_QUOTE :
-                    offset_freq *= 1.2
+                    params.offset_freq *= 1.2
                     if verbose :
-                        print( "Offset frequency up to: " + str( offset_freq ) )
+                        print( "Offset frequency up to: " + str( params.offset_freq ) )
                 
                 elif e.key == K_7:
-                    rot_freq *= 0.8
+                    params.rot_freq *= 0.8
                     if verbose :
-                        print( "Rotate frequency down to: " + str( rot_freq ) )
+                        print( "Rotate frequency down to: " + str( params.rot_freq ) )
                 
                 elif e.key == K_8:
-                    rot_freq *= 1.2
+                    params.rot_freq *= 1.2
                     if verbose :
-                        print( "Rotate frequency up to: " + str( rot_freq ) )
+                        print( "Rotate frequency up to: " + str( params.rot_freq ) )
                     
                 elif e.key == K_9:
-                    scale_freq *= 0.8
+                    params.scale_freq *= 0.8
                     if verbose :
-                        print( "Scale frequency down to: " + str( scale_freq ) )
+                        print( "Scale frequency down to: " + str( params.scale_freq ) )
                     
                 elif e.key == K_0 :
-                    scale_freq *= 1.2
+                    params.scale_freq *= 1.2
                     if verbose :
-                        print( "Scale frequency up to: " + str( scale_freq ) )
+                        print( "Scale frequency up to: " + str( params.scale_freq ) )
 
                 elif e.key == K_q :
                     if pygame.key.get_mods( ) & KMOD_CTRL :
@@ -499,25 +2898,80 @@ if __name__ == '__main__' :
 
                 elif e.key == K_EQUALS :
                     
-                    shutter_length = 7.0
-                    # exposure = 1.5
-                    offset = [ -1.57, 3.08 ]
-                    freq = 0.3
-                    hueFreq = 0.082176
+                    params.shutter_length = 7.0
+                    # params.exposure = 1.5
+                    params.offset = [ -1.57, 3.08 ]
+                    params.freq = 0.3
+                    params.hue_freq = 0.082176
                     # phaseSpeed is in seconds
                     phase_speed = 0.8
-                    offset_freq = 0.00633
-                    scale_freq = 114.0
-                    rot_freq = 0.49152
+                    params.offset_freq = 0.00633
+                    params.scale_freq = 114.0
+                    params.rot_freq = 0.49152
 
                     if verbose :
                         print( "Freq and offsets reset" )
                 
                 elif e.key == K_MINUS :
-                    freq = --freq
+                    params.freq = --params.freq
                     if verbose :
                         print( "Freq reversed" )
                     
+                elif e.key == K_a :
+                    adaptive = not adaptive
+                    sampler = AdaptiveSampler()
+                    if verbose :
+                        print( "Adaptive sampling: " + str( adaptive ) )
+                    
+                elif e.key == K_t :
+                    accumulate = not accumulate
+                    if accumulator is not None :
+                        accumulator.clear()
+                    if verbose :
+                        print( "Sub-frame accumulation (approximate offset wave): " + str( accumulate ) )
+                    
+                elif e.key == K_s :
+                    use_shader = not use_shader
+                    if verbose :
+                        print( "Shader mode: " + str( use_shader ) )
+                    
+                elif e.key == K_f :
+                    use_float = not use_float
+                    if verbose :
+                        print( "Float accumulation: " + str( use_float ) )
+                    
+                elif e.key == K_m :
+                    toneMapNames = sorted( toneMaps )
+                    params.tone_map = toneMapNames[ ( toneMapNames.index( params.tone_map ) + 1 ) %
+                                                    len( toneMapNames ) ]
+                    if verbose :
+                        print( "Tone map: " + params.tone_map )
+                    
+                elif e.key == K_p :
+                    use_proxy = not use_proxy
+                    if verbose :
+                        print( "Interaction proxy: " + str( use_proxy ) )
+                    
+                elif e.key == K_c :
+                    show_sheet = not show_sheet
+                    if verbose :
+                        print( "Contact sheet: " + str( show_sheet ) )
+                    
+                elif e.key == K_l :
+                    if timeline is None :
+                        timeline = TimelineWriter( timelineFile, txlist, width, height )
+                        if verbose :
+                            print( "Logging parameters to " + timelineFile )
+                    else :
+                        timeline.close()
+                        timeline = None
+                        if verbose :
+                            print( "Stopped logging parameters" )
+                    
+                elif e.key == K_F3 :
+                    show_hud = not show_hud
+                    hud_text = []
+                    
                 elif e.key == K_ESCAPE:
                     if verbose :
                         print( "User pressed escape, exiting.." )
@@ -534,6 +2988,11 @@ if __name__ == '__main__' :
                             print( "Recording frames ...." )
                     else:
                         # print( "%d frames recorded." % recordedFrameNumber )
+                        if recorder is not None :
+                            recorderStats = recorder.close()
+                            recorder = None
+                            if verbose :
+                                print( "Recorder: " + str( recorderStats ) )
                         if verbose :
                             print( "Recording stopped ...." )
                         
@@ -548,27 +3007,82 @@ if __name__ == '__main__' :
                         vflags = video_flags_fullscreen
                         fullscreen = True
                     
+                    # the recorder's pixel buffers belong to the old context
+                    if recorder is not None :
+                        recorder.close()
+                        recorder = None
+                    # as do the accumulator's segment textures
+                    if accumulator is not None :
+                        accumulator.close()
+                        accumulator = None
+                    if float_buffer is not None :
+                        float_buffer.close()
+                        float_buffer = None
+                    if proxy_buffer is not None :
+                        proxy_buffer.close()
+                        proxy_buffer = None
+                    
                     screen = pygame.display.set_mode( ( width, height ), vflags )
                     pygame.display.set_caption( animName )
                     resizeGL( width, height )
                     initGL()
-                    textures = loadTextureGL( txlist )
+                    # textures are uploaded again from the cache as they are selected
+                    if not textures.isResident() :
+                        textures.forget()
+                    if sheet_atlas is not None and not texturesResident( [ sheet_atlas ] ) :
+                        sheet_atlas = None
                     
+            elif e.type == MOUSEBUTTONDOWN and e.button == 1 and show_sheet :
+                # pick the clicked cell's texture and go back to it full screen
+                for cell, ( x, y, cellWidth, cellHeight ) in enumerate( getSheetWindows( len( txlist ), width, height ) ) :
+                    if x <= e.pos[0] < x + cellWidth and y <= height - 1 - e.pos[1] < y + cellHeight :
+                        params.texture = cell
+                        show_sheet = False
+                        
             elif e.type == MOUSEMOTION:
+                if any( e.buttons ) :
+                    last_input_time = time.time()
                 # print( "mouse motion, pos: " + str( e.pos ) + " rel: " + str( e.rel ) + " buttons: " + str( e.buttons ) )
                 if e.buttons[0] :
-                    offset[0] += e.rel[0] / 100.0
-                    offset[1] += e.rel[1] / 100.0
-                    # print( "Offset is now: " + str( offset ) )
+                    params.offset[0] += e.rel[0] / 100.0
+                    params.offset[1] += e.rel[1] / 100.0
+                    # print( "Offset is now: " + str( params.offset ) )
                 if e.buttons[1] :
-                    offset[0] = 0
-                    offset[1] = 0
+                    params.offset[0] = 0
+                    params.offset[1] = 0
                     # print( "Offset is ZERO" )
                 if e.buttons[2] :
-                    offset[0] = ( ( e.pos[0] / float( width ) ) - 0.5 ) * -10
-                    offset[1] = ( ( e.pos[1] / float( height ) ) - 0.5 ) * -10
-                    # print( "Offset is now: " + str( offset ) )
+                    params.offset[0] = ( ( e.pos[0] / float( width ) ) - 0.5 ) * -10
+                    params.offset[1] = ( ( e.pos[1] / float( height ) ) - 0.5 ) * -10
+                    # print( "Offset is now: " + str( params.offset ) )
+        
+        profiler.mark( 'events' )
+        profiler.endFrame()
+        if adaptive :
+            sampler.update( profiler.getLastFrameTime() )
                             
+    textures.close()
+    if timeline is not None :
+        timeline.close()
+    if accumulator is not None :
+        accumulator.close()
+    if float_buffer is not None :
+        float_buffer.close()
+    if proxy_buffer is not None :
+        proxy_buffer.close()
+    if recorder is not None :
+        recorderStats = recorder.close()
+        if verbose :
+            print( "Recorder: " + str( recorderStats ) )
+    if sink is not None :
+        sink.close()
+    if profile_file :
+        try :
+            profiler.export( profile_file )
+            print( "Wrote frame timings to " + profile_file )
+        except OSError as e :
+            print( "Could not write frame timings to %s: %s" % ( profile_file, e ) )
+    
     # tell the user we have finished
     if verbose :
         print( "%d frames saved." % recorded_frame_number )
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+
+# glimmera_bench
+
+#    Copyright (c) 2006 Dan Wills.
+#
+#    'glimmera' is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 2.
+#
+#    'glimmera' is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with 'glimmera'; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+__description__
+
+Benchmarks for glimmera's rendering, texture loading and frame writing.
+
+__info__
+
+Every run uses defaultParameters, the same frame numbers and generated
+textures and frames, so results from different runs and machines compare.
+The GL benchmarks need a GL context but no display: with --headless SDL's
+offscreen driver is used, which gives Mesa's llvmpipe on GPU-less machines.
+Results are printed, or written with --output, as JSON.
+
+    python glimmera_bench.py --headless --output bench.json
+    python glimmera_bench.py --only render --backend software --samples 16,65 --sizes 256,512
+
+@author:    Dan Wills
+@copyright:    2008 Dan Wills
+@license:    GNU GPL version 2
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+os.environ.setdefault( 'PYGAME_HIDE_SUPPORT_PROMPT', '1' )
+
+# frame numbers every render benchmark cycles through, spread over the animation
+benchFrames = [ 0, 37, 250, 1000, 4321 ]
+
+def parseList( text ) :
+    return [ int( value ) for value in text.split( ',' ) if value ]
+
+def timeRepeated( function, repeats ) :
+    """
+    Returns the best and mean seconds of repeats calls to function.
+    """
+    times = []
+    for i in range( repeats ) :
+        startTime = time.perf_counter()
+        function( i )
+        times.append( time.perf_counter() - startTime )
+    return min( times ), sum( times ) / len( times )
+
+def makeTestTexture( glimmera, size, directory ) :
+    """
+    Writes a deterministic size x size JPEG texture and returns its filename.
+    """
+    np = glimmera.np
+    y, x = np.mgrid[ 0:size, 0:size ] / float( size )
+    rgb = np.stack( [ np.sin( x * 31.0 ) * 0.5 + 0.5, np.cos( y * 17.0 + x * 5.0 ) * 0.5 + 0.5,
+                      ( x * y * 7.0 ) % 1.0 ], axis=-1 )
+    pixels = ( rgb * 255 ).astype( np.uint8 )
+    surface = glimmera.pygame.image.frombuffer( pixels.tobytes(), ( size, size ), "RGB" )
+    filename = os.path.join( directory, "bench_%d.jpg" % size )
+    glimmera.pygame.image.save( surface, filename )
+    return filename
+
+def openWindow( glimmera, frame_width, frame_height ) :
+    pygame = glimmera.pygame
+    pygame.display.set_mode( ( frame_width, frame_height ), pygame.locals.OPENGL | pygame.locals.DOUBLEBUF )
+    glimmera.resizeGL( frame_width, frame_height )
+    glimmera.initGL()
+
+def benchRenderArgs( glimmera, samples ) :
+    """
+    Returns the drawFrame arguments after frame_number for defaultParameters.
+    """
+    p = glimmera.defaultParameters
+    return ( p[ 'freq' ], p[ 'shutter_length' ], p[ 'shutter_fade_width' ], samples,
+             glimmera.getShutterSum( samples, p[ 'shutter_fade_width' ] ), p[ 'exposure' ], p[ 'offset' ],
+             p[ 'hue_freq' ], p[ 'scale_freq' ], p[ 'offset_freq' ], p[ 'rot_freq' ],
+             p[ 'offset_wave_amps' ], p[ 'offset_wave_freqs' ] )
+
+def benchRender( glimmera, backend, texture_file, sample_counts, sizes, repeats ) :
+    results = []
+    for size in sizes :
+        if backend in ( 'gl', 'shader' ) :
+            openWindow( glimmera, size, size )
+            texture = glimmera.loadTextureGL( [ texture_file ] )[ 0 ]
+        else :
+            texture = glimmera.loadTextureImage( texture_file, mipmaps=True )
+
+        for samples in sample_counts :
+            args = benchRenderArgs( glimmera, samples )
+
+            if backend == 'gl' :
+                def render( i ) :
+                    glimmera.drawFrame( texture, benchFrames[ i % len( benchFrames ) ], *args )
+                    glimmera.glFinish()
+            elif backend == 'shader' :
+                def render( i ) :
+                    glimmera.drawFrameShader( texture, benchFrames[ i % len( benchFrames ) ], *args )
+                    glimmera.glFinish()
+            else :
+                def render( i ) :
+                    glimmera.drawFrameSoftware( texture, benchFrames[ i % len( benchFrames ) ], *args,
+                                                frame_width=size, frame_height=size )
+
+            render( 0 )
+            best, mean = timeRepeated( render, repeats )
+            results.append( { 'backend' : backend, 'width' : size, 'height' : size,
+                              'shutter_samples' : samples, 'best_s' : best, 'mean_s' : mean,
+                              'fps' : 1.0 / mean } )
+            print( "render %s %dx%d %d samples: %.1f fps" % ( backend, size, size, samples, 1.0 / mean ),
+                   file=sys.stderr )
+
+        if backend in ( 'gl', 'shader' ) :
+            glimmera.glDeleteTextures( [ texture ] )
+    return results
+
+def benchLoad( glimmera, texture_sizes, repeats, directory, use_gl ) :
+    results = []
+    cacheDir = glimmera.textureCacheDir
+    for size in texture_sizes :
+        textureFile = makeTestTexture( glimmera, size, directory )
+
+        # decoding every time, as with no texture cache
+        glimmera.textureCacheDir = None
+        decodeBest, decodeMean = timeRepeated( lambda i : glimmera.loadTextureData( textureFile ), repeats )
+
+        # mapped from a warm texture cache
+        glimmera.textureCacheDir = os.path.join( directory, "cache" )
+        glimmera.loadTextureData( textureFile )
+        cachedBest, cachedMean = timeRepeated(
+            lambda i : glimmera.np.array( glimmera.loadTextureData( textureFile ) ), repeats )
+
+        result = { 'texture_size' : size, 'decode_s' : decodeMean, 'cached_s' : cachedMean }
+        if use_gl :
+            def upload( i ) :
+                glimmera.glDeleteTextures( glimmera.loadTextureGL( [ textureFile ] ) )
+                glimmera.glFinish()
+            result[ 'load_gl_s' ] = timeRepeated( upload, repeats )[ 1 ]
+        results.append( result )
+        print( "load %dx%d: decode %.1fms, cached %.1fms" % ( size, size, decodeMean * 1000, cachedMean * 1000 ),
+               file=sys.stderr )
+    glimmera.textureCacheDir = cacheDir
+    return results
+
+def benchWrite( glimmera, sink_types, size, repeats, directory ) :
+    # a rendered frame compresses like a real one, unlike noise or flat colour
+    texture = glimmera.getMipPyramid( glimmera.np.random.default_rng( 1 ).random( ( 64, 64, 3 ), dtype='float32' ) )
+    image = glimmera.drawFrameSoftware( texture, benchFrames[ 1 ], *benchRenderArgs( glimmera, 32 ),
+                                        frame_width=size, frame_height=size )
+    pixels = glimmera.imageToPixels( image )
+    results = []
+    for sinkType in sink_types :
+        outputDir = os.path.join( directory, "write_" + sinkType )
+        os.makedirs( outputDir )
+        if sinkType == 'png' :
+            sink = glimmera.PngSink( outputDir )
+        else :
+            sink = glimmera.frameSinks[ sinkType ]( os.path.join( outputDir, "frames" ) )
+
+        startTime = time.perf_counter()
+        for i in range( repeats ) :
+            sink.write( pixels, i )
+        sink.close()
+        elapsed = time.perf_counter() - startTime
+
+        outputBytes = sum( os.path.getsize( os.path.join( outputDir, f ) ) for f in os.listdir( outputDir ) )
+        results.append( { 'sink' : sinkType, 'width' : size, 'height' : size, 'frames' : repeats,
+                          'fps' : repeats / elapsed, 'bytes_per_frame' : outputBytes // repeats } )
+        print( "write %s %dx%d: %.1f fps" % ( sinkType, size, size, repeats / elapsed ), file=sys.stderr )
+    return results
+
+def getEnvironment( glimmera, use_gl ) :
+    environment = { 'python' : platform.python_version(), 'platform' : platform.platform(),
+                    'machine' : platform.machine(), 'cpus' : os.cpu_count(),
+                    'numpy' : glimmera.np.__version__, 'pygame' : glimmera.pygame.version.ver }
+    if use_gl :
+        environment[ 'gl_renderer' ] = glimmera.glGetString( glimmera.GL_RENDERER ).decode()
+        environment[ 'gl_version' ] = glimmera.glGetString( glimmera.GL_VERSION ).decode()
+    return environment
+
+def main() :
+    parser = argparse.ArgumentParser( description="Benchmark glimmera rendering, texture loading and frame writing." )
+    parser.add_argument( '--only', default='render,load,write', help="comma separated benchmarks to run" )
+    parser.add_argument( '--backend', default='gl,shader,software', help="render backends, gl, shader and/or software" )
+    parser.add_argument( '--samples', help="shutter sample counts, default 65,260,1040 for gl, 65,260 for shader "
+                                           "and 16,65 for software" )
+    parser.add_argument( '--sizes', help="square render sizes, default 256,512,1024 for gl and 256,512 for "
+                                         "shader and software" )
+    parser.add_argument( '--texture', default='textures/lump.jpg', help="texture for the render benchmark" )
+    parser.add_argument( '--texture-sizes', default='256,512,1024,2048' )
+    parser.add_argument( '--write-size', type=int, default=1024 )
+    parser.add_argument( '--sinks', default=','.join( sorted( [ 'png', 'raw', 'y4m', 'memmap' ] ) ) )
+    parser.add_argument( '--repeats', type=int, default=5 )
+    parser.add_argument( '--headless', action='store_true', help="use SDL's offscreen video driver" )
+    parser.add_argument( '--output', help="write the JSON results here instead of stdout" )
+    args = parser.parse_args()
+
+    if args.headless :
+        # SDL's offscreen driver creates its contexts through EGL
+        os.environ[ 'SDL_VIDEODRIVER' ] = 'offscreen'
+        os.environ.setdefault( 'PYOPENGL_PLATFORM', 'egl' )
+    import glimmera
+
+    benchmarks = args.only.split( ',' )
+    backends = args.backend.split( ',' )
+    useGl = ( 'gl' in backends or 'shader' in backends ) and ( 'render' in benchmarks or 'load' in benchmarks )
+    if useGl and glimmera.openGLError is not None :
+        parser.error( "the gl and shader backends need OpenGL, which could not be loaded (%s), "
+                      "try --backend software" % glimmera.openGLError )
+    if useGl :
+        glimmera.pygame.init()
+        openWindow( glimmera, 64, 64 )
+
+    results = { 'environment' : getEnvironment( glimmera, useGl ), 'repeats' : args.repeats,
+                'frames' : benchFrames, 'parameters' : glimmera.defaultParameters }
+    tempDir = tempfile.mkdtemp( prefix="glimmera_bench_" )
+    try :
+        if 'render' in benchmarks :
+            results[ 'render' ] = []
+            for backend in backends :
+                defaultSamples, defaultSizes = { 'gl' : ( '65,260,1040', '256,512,1024' ),
+                                                 'shader' : ( '65,260', '256,512' ),
+                                                 'software' : ( '16,65', '256,512' ) }[ backend ]
+                results[ 'render' ] += benchRender( glimmera, backend, args.texture,
+                                                    parseList( args.samples or defaultSamples ),
+                                                    parseList( args.sizes or defaultSizes ), args.repeats )
+        if 'load' in benchmarks :
+            results[ 'load' ] = benchLoad( glimmera, parseList( args.texture_sizes ), args.repeats, tempDir, useGl )
+        if 'write' in benchmarks :
+            results[ 'write' ] = benchWrite( glimmera, args.sinks.split( ',' ), args.write_size,
+                                             args.repeats, tempDir )
+    finally :
+        shutil.rmtree( tempDir, ignore_errors=True )
+
+    resultsJson = json.dumps( results, indent=4, sort_keys=True )
+    if args.output :
+        with open( args.output, 'w' ) as outputFile :
+            outputFile.write( resultsJson + "\n" )
+    else :
+        print( resultsJson )
+
+if __name__ == '__main__' :
+    main()
@@ -0,0 +1,504 @@
+#!/usr/bin/env python
+
+# glimmera_render
+
+#    Copyright (c) 2006 Dan Wills.
+#
+#    'glimmera' is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 2.
+#
+#    'glimmera' is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with 'glimmera'; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+__description__
+
+Offline batch rendering of glimmera frames, without a display.
+
+__info__
+
+Every frame is a function of its frame number, the animation parameters and
+the texture only, so a frame range can be rendered in any order, split over
+a pool of processes on one machine or sharded over several machines with
+--shard, and the frames come out the same as rendering them one by one.
+
+    python glimmera_render.py --params take.json --texture textures/lump.jpg --frames 0:500
+    python glimmera_render.py --texture textures/lump.jpg --frames 0:500 --shard 2/4 --processes 8
+    python glimmera_render.py --texture textures/lump.jpg --frames 0:500 --sink y4m --output - | ffmpeg -i - take.mp4
+
+The parameter file is JSON with any of the keys of glimmera.defaultParameters,
+--dump-params writes the defaults as a starting point. Frames are tone mapped
+with the parameters' tone_map and written as 8 or 16 bit, or with --depth float
+as linear float32 straight from the float renders (raw and memmap sinks).
+
+With --accumulate each process draws frames from cached shutter segments, see
+glimmera.SubframeAccumulator, which is much faster for runs of consecutive
+frames; processes are then given runs of accumulateChunk frames at a time.
+It is an approximation: the segments cannot follow the offset wave from frame
+to frame, so the frames only match the normal render with offset_wave_amps
+at zero.
+
+--timeline replays a parameter timeline logged by the viewer (L key), with its
+textures and parameters changing frame by frame, over the frames it logged
+unless --frames is given. --samples overrides the shutter sample count of
+parameter files and timelines alike.
+
+    python glimmera_render.py --timeline renderframes/glimmera_timeline.jsonl --size 2048x2048 --samples 1040
+
+With --tile N frames of any size are rendered N x N pixels at a time and
+streamed band by band into their PNGs by the process rendering them, so only
+one band of tiles is ever held in memory. --gl draws the tiles with OpenGL
+into an offscreen float buffer, each through its own part of the viewer's
+frustum, in one process with a hidden window (SDL_VIDEODRIVER=offscreen where
+there is no display).
+
+    python glimmera_render.py --texture textures/lump.jpg --size 7680x4320 --tile 1024 --gl --frames 0:10
+
+--sheet renders every frame as a contact sheet, a grid with one cell for each
+texture in a directory or glob, and --variants one for each of several
+parameter files, to audition a texture library or parameter variants at once.
+
+    python glimmera_render.py --sheet textures --frames 100 --size 2048x2048
+    python glimmera_render.py --texture textures/lump.jpg --variants slow.json fast.json wide.json --frames 100
+
+Spreading frames over processes does not help a still or a short run, so with
+--split each frame's shutter samples are split over the processes instead,
+one per core unless --processes says otherwise, and at least two. Each draws
+its share into a partial image in shared memory, and the partial images are
+summed and normalized by exposure / shutter sum once, here.
+
+    python glimmera_render.py --texture textures/lump.jpg --frames 100 --size 4096x4096 --samples 8000 --split
+    python glimmera_render.py --texture textures/lump.jpg --frames 100 --samples 8000 --split --processes 4
+
+Rendered frames are kept in a frame cache (glimmera.FrameCache), keyed by a
+hash of everything that goes into them, so rendering a take again after
+changing part of its parameters, texture or timeline only renders the frames
+that changed. --no-cache renders everything, --cache-dir moves the cache.
+
+@author:    Dan Wills
+@copyright:    2008 Dan Wills
+@license:    GNU GPL version 2
+"""
+
+import argparse
+import functools
+import glob
+import json
+import multiprocessing
+import multiprocessing.shared_memory
+import os
+import sys
+import time
+
+# frames may be streamed to stdout, so keep pygame's import banner off it
+os.environ.setdefault( 'PYGAME_HIDE_SUPPORT_PROMPT', '1' )
+import glimmera
+
+# set in each worker process by initWorker
+workerSize = None
+workerDepth = None
+workerAccumulator = None
+workerTile = None
+workerSink = None
+workerFloatBuffer = None
+workerSheet = None
+# shared memory name -> ( SharedMemory, partial images ) attached by --split workers
+workerPartials = {}
+
+# consecutive frames handed to each process at a time with --accumulate
+accumulateChunk = 16
+
+def isParameterValue( value, default ) :
+    """
+    Returns whether value can stand in for a parameter's default value: an
+    int for an int, any number for a float, a list of as many numbers for a
+    list, and a string for a string.
+    """
+    if isinstance( value, bool ) :
+        return False
+    if isinstance( default, int ) :
+        return isinstance( value, int )
+    if isinstance( default, float ) :
+        return isinstance( value, ( int, float ) )
+    if isinstance( default, ( list, tuple ) ) :
+        return ( isinstance( value, ( list, tuple ) ) and len( value ) == len( default ) and
+                 all( isParameterValue( item, float( defaultItem ) ) for item, defaultItem in zip( value, default ) ) )
+    return isinstance( value, type( default ) )
+
+def updateParameters( parameters, values, source ) :
+    """
+    Returns parameters updated with values, raising ValueError naming source
+    for unknown parameters, values not of the type of their default, or
+    unknown tone maps.
+    """
+    unknown = set( values ) - set( parameters )
+    if unknown :
+        raise ValueError( "unknown parameters in %s: %s" % ( source, ", ".join( sorted( unknown ) ) ) )
+    for name, value in values.items() :
+        if not isParameterValue( value, parameters[ name ] ) :
+            raise ValueError( "parameter %s in %s is %r, where the default is %r" % ( name, source, value, parameters[ name ] ) )
+    parameters = dict( parameters, **values )
+    if parameters[ 'tone_map' ] not in glimmera.toneMaps :
+        raise ValueError( "unknown tone_map %r, not one of %s" % ( parameters[ 'tone_map' ],
+                                                                ", ".join( sorted( glimmera.toneMaps ) ) ) )
+    return parameters
+
+def loadParameters( params_file ) :
+    """
+    Returns defaultParameters updated with the values from a JSON file.
+    """
+    fileParameters = {}
+    if params_file :
+        with open( params_file ) as paramsFile :
+            fileParameters = json.load( paramsFile )
+    return updateParameters( glimmera.defaultParameters, fileParameters, params_file )
+
+def parseFrameRange( frame_range ) :
+    """
+    Parses 'start:end' (end exclusive) or a single frame number.
+    """
+    if ':' in frame_range :
+        start, end = frame_range.split( ':' )
+        return range( int( start ), int( end ) )
+    return range( int( frame_range ), int( frame_range ) + 1 )
+
+def getShardFrames( frames, shard ) :
+    """
+    Returns shard 'i/n' (1 based) of frames, as a contiguous block so stream
+    outputs from consecutive shards can be joined end to end.
+    """
+    index, count = [ int( s ) for s in shard.split( '/' ) ]
+    if not 1 <= index <= count :
+        raise ValueError( "shard %s is not in 1/%d .. %d/%d" % ( shard, count, count, count ) )
+    start = ( index - 1 ) * len( frames ) // count
+    end = index * len( frames ) // count
+    return frames[ start:end ]
+
+def parseSize( size ) :
+    frameWidth, frameHeight = size.lower().split( 'x' )
+    return int( frameWidth ), int( frameHeight )
+
+def getFrameTasks( frames, texture_file=None, parameters=None, timeline=None, samples=None ) :
+    """
+    Returns the ( frame_number, texture_file, parameters ) to render for each
+    frame, from a timeline if given, otherwise the same for every frame.
+    """
+    tasks = []
+    for frameNumber in frames :
+        if timeline is not None :
+            frameParameters = timeline.getParameters( frameNumber )
+            frameTexture = timeline.getTextureFile( frameParameters )
+        else :
+            frameParameters = parameters
+            frameTexture = texture_file
+        if samples :
+            frameParameters = dict( frameParameters, shutter_samples=samples )
+        tasks.append( ( frameNumber, frameTexture, frameParameters ) )
+    return tasks
+
+def getSheetCells( sheet=None, variants=None, texture_file=None, parameters=None, samples=None ) :
+    """
+    Returns the ( texture_file, parameters ) of each contact sheet cell, one
+    for each texture matching sheet, or each parameter file in variants, or
+    None when neither is given.
+    """
+    if sheet :
+        pattern = os.path.join( sheet, '*' ) if os.path.isdir( sheet ) else sheet
+        cells = [ ( textureFile, parameters ) for textureFile in sorted( glob.glob( pattern ) )
+                  if os.path.isfile( textureFile ) ]
+        if not cells :
+            raise ValueError( "no textures match %s" % sheet )
+    elif variants :
+        cells = [ ( texture_file, loadParameters( paramsFile ) ) for paramsFile in variants ]
+    else :
+        return None
+    if samples :
+        cells = [ ( textureFile, dict( cellParameters, shutter_samples=samples ) ) for textureFile, cellParameters in cells ]
+    return cells
+
+def initWorker( size, depth='8', accumulate=False, tile=None, output=None, gl=False, sheet=None ) :
+    global workerSize, workerDepth, workerAccumulator, workerTile, workerSink, workerFloatBuffer, workerSheet
+    workerSize = size
+    workerDepth = depth
+    if sheet :
+        # every cell's texture, scaled down to about the size of its cell
+        cellSize = max( 1, max( glimmera.getSheetWindows( len( sheet ), size[0], size[1] )[0][2:] ) )
+        cellTextures = {}
+        for textureFile, parameters in sheet :
+            if textureFile not in cellTextures :
+                cellTextures[ textureFile ] = glimmera.loadTextureImage( textureFile, mipmaps=True, size=cellSize )
+        workerSheet = ( [ cellTextures[ textureFile ] for textureFile, parameters in sheet ],
+                        [ parameters for textureFile, parameters in sheet ] )
+    if accumulate :
+        workerAccumulator = glimmera.SubframeAccumulator( glimmera.SoftwareSubframes( size[0], size[1] ) )
+    if tile :
+        workerTile = tile
+        workerSink = glimmera.PngSink( output or glimmera.frameSinkOutputs[ 'png' ] )
+    if gl :
+        glimmera.pygame.display.init()
+        glimmera.pygame.display.set_mode( ( 64, 64 ), glimmera.OPENGL | glimmera.DOUBLEBUF | glimmera.pygame.HIDDEN )
+        glimmera.initGL()
+        workerFloatBuffer = glimmera.FloatFramebuffer( tile, tile )
+
+# timelines can switch between textures, so keep a few decoded in each process
+@functools.lru_cache( maxsize=4 )
+def loadWorkerTexture( texture_file ) :
+    if workerFloatBuffer is not None :
+        # mip mapped like the software tiles and the viewer, so shrinking quads match
+        return glimmera.loadTextureGL( [ texture_file ], mipmaps=True )[ 0 ]
+    return glimmera.loadTextureImage( texture_file, mipmaps=True )
+
+def renderWorkerTiles( texture, frame_number, parameters ) :
+    """
+    Streams frame_number tile by tile into its PNG with workerSink.
+    """
+    frameWidth, frameHeight = workerSize
+    if workerFloatBuffer is not None :
+        def renderTile( window ) :
+            return glimmera.renderTileGL( workerFloatBuffer, texture, frame_number, parameters,
+                                          frameWidth, frameHeight, window )
+    else :
+        def renderTile( window ) :
+            return glimmera.renderFrameSoftware( texture, frame_number, parameters, frameWidth, frameHeight, window )
+    pixelBands = ( glimmera.imageToPixels( glimmera.toneMapImage( band, tone_map=parameters[ 'tone_map' ] ),
+                                           glimmera.pixelDepths[ workerDepth ] )
+                   for band in glimmera.iterTiledBands( renderTile, frameWidth, frameHeight, workerTile ) )
+    workerSink.writeBands( pixelBands, frame_number, frameWidth, frameHeight )
+
+def renderWorkerFrame( task ) :
+    frame_number, texture_file, parameters = task
+    if workerSheet is not None :
+        image = glimmera.renderContactSheetSoftware( workerSheet[0], workerSheet[1], frame_number,
+                                                     workerSize[0], workerSize[1] )
+        if workerDepth != 'float' :
+            image = glimmera.toneMapImage( image, tone_map=parameters[ 'tone_map' ] )
+        return frame_number, glimmera.imageToPixels( image, glimmera.pixelDepths[ workerDepth ] )
+    texture = loadWorkerTexture( texture_file )
+    if workerTile :
+        # written by the worker itself, so there are no pixels to pass back
+        renderWorkerTiles( texture, frame_number, parameters )
+        return frame_number, None
+    if workerAccumulator is not None and parameters[ 'freq' ] != 0 and parameters[ 'shutter_length' ] > 0 :
+        image = glimmera.renderFrameAccumulated( workerAccumulator, texture, frame_number, parameters )
+    else :
+        image = glimmera.renderFrameSoftware( texture, frame_number, parameters, workerSize[0], workerSize[1] )
+    if workerDepth != 'float' :
+        image = glimmera.toneMapImage( image, tone_map=parameters[ 'tone_map' ] )
+    return frame_number, glimmera.imageToPixels( image, glimmera.pixelDepths[ workerDepth ] )
+
+def getWorkerPartials( shared_name ) :
+    """
+    Returns the partial images array in the shared memory renderSplitFrames
+    created, attaching to it the first time.
+    """
+    if shared_name not in workerPartials :
+        sharedMemory = multiprocessing.shared_memory.SharedMemory( shared_name )
+        frameWidth, frameHeight = workerSize
+        parts = sharedMemory.size // ( frameWidth * frameHeight * 3 * 4 )
+        workerPartials[ shared_name ] = ( sharedMemory, glimmera.np.ndarray(
+            ( parts, frameHeight, frameWidth, 3 ), dtype=glimmera.np.float32, buffer=sharedMemory.buf ) )
+    return workerPartials[ shared_name ][ 1 ]
+
+def renderWorkerSamples( task ) :
+    shared_name, part, frame_number, texture_file, parameters, sample_range = task
+    partials = getWorkerPartials( shared_name )
+    partials[ part ] = glimmera.renderFrameSoftware( loadWorkerTexture( texture_file ), frame_number, parameters,
+                                                     workerSize[0], workerSize[1], sample_range=sample_range )
+    return part
+
+def renderSplitFrames( tasks, size, depth='8', parts=2, worker_args=() ) :
+    """
+    Yields the ( frame_number, pixels ) of each task, its shutter samples split
+    in parts rendered by a pool of as many processes into shared memory, then
+    summed and normalized once.
+    """
+    np = glimmera.np
+    frameWidth, frameHeight = size
+    # created before the pool, so the workers share this process's resource
+    # tracker rather than each starting one that unlinks the memory as it exits
+    sharedMemory = multiprocessing.shared_memory.SharedMemory( create=True,
+                                                               size=parts * frameHeight * frameWidth * 3 * 4 )
+    partials = np.ndarray( ( parts, frameHeight, frameWidth, 3 ), dtype=np.float32, buffer=sharedMemory.buf )
+    pool = multiprocessing.Pool( parts, initWorker, worker_args )
+    try :
+        for frameNumber, textureFile, parameters in tasks :
+            samples = parameters[ 'shutter_samples' ]
+            bounds = [ samples * part // parts for part in range( parts + 1 ) ]
+            pool.map( renderWorkerSamples, [ ( sharedMemory.name, part, frameNumber, textureFile, parameters,
+                                               ( bounds[ part ], bounds[ part + 1 ] ) ) for part in range( parts ) ], 1 )
+            image = partials.sum( axis=0 )
+            image *= np.float32( parameters[ 'exposure' ] /
+                                 glimmera.getShutterSum( samples, parameters[ 'shutter_fade_width' ] ) )
+            if depth != 'float' :
+                image = glimmera.toneMapImage( image, tone_map=parameters[ 'tone_map' ] )
+            yield frameNumber, glimmera.imageToPixels( image, glimmera.pixelDepths[ depth ] )
+    finally :
+        pool.terminate()
+        # the buffer cannot be closed while an array still views it
+        del partials
+        sharedMemory.close()
+        sharedMemory.unlink()
+
+def renderFrames( tasks, sink, size, processes=1, depth='8', accumulate=False, tile=None, output=None, gl=False,
+                  sheet=None, split=False, cache=None ) :
+    """
+    Renders getFrameTasks tasks into sink, on a pool of processes when
+    processes > 1. Frames reach the sink in order whatever the pool does.
+    Tiled frames, with tile set, are written into output by the workers, and
+    with sheet, a list of ( texture_file, parameters ) cells, each frame is
+    their contact sheet. With split the processes share each frame's samples.
+    Frames already in cache, a glimmera.FrameCache, are not rendered again.
+    """
+    startTime = time.time()
+    startHits = cache.hits if cache is not None else 0
+
+    if cache is not None :
+        renderer = 'accumulate' if accumulate else 'software'
+        keys = [ cache.getKey( frameNumber, textureFile, parameters, size[0], size[1], depth, renderer )
+                 for frameNumber, textureFile, parameters in tasks ]
+    else :
+        keys = [ None ] * len( tasks )
+    cached = [ key is not None and cache.touch( key ) for key in keys ]
+    renderTasks = [ task for task, isCached in zip( tasks, cached ) if not isCached ]
+    if not renderTasks :
+        processes = 1
+
+    workerArgs = ( size, depth, accumulate, tile, output, gl, sheet )
+    if processes > 1 and split :
+        pool = None
+        renderedFrames = renderSplitFrames( renderTasks, size, depth, processes, workerArgs )
+    elif processes > 1 :
+        pool = multiprocessing.Pool( processes, initWorker, workerArgs )
+        renderedFrames = pool.imap( renderWorkerFrame, renderTasks, accumulateChunk if accumulate else 1 )
+    else :
+        pool = None
+        initWorker( *workerArgs )
+        renderedFrames = ( renderWorkerFrame( task ) for task in renderTasks )
+
+    try :
+        for task, key, isCached in zip( tasks, keys, cached ) :
+            pixels = cache.get( key ) if isCached else None
+            if pixels is not None :
+                frameNumber = task[0]
+                print( "cached frame %d" % frameNumber, file=sys.stderr )
+            else :
+                if isCached :
+                    # evicted by another render since, so render it here
+                    if workerSize is None :
+                        initWorker( *workerArgs )
+                    frameNumber, pixels = renderWorkerFrame( task )
+                else :
+                    frameNumber, pixels = next( renderedFrames )
+                if key is not None :
+                    cache.put( key, pixels )
+                print( "rendered frame %d" % frameNumber, file=sys.stderr )
+            if pixels is not None :
+                sink.write( pixels, frameNumber )
+    finally :
+        if pool is not None :
+            pool.terminate()
+        if split :
+            renderedFrames.close()
+        sink.close()
+
+    elapsed = time.time() - startTime
+    cacheHits = cache.hits - startHits if cache is not None else 0
+    print( "%d frames in %.1fs, %d from the frame cache" % ( len( tasks ), elapsed, cacheHits ), file=sys.stderr )
+
+def main() :
+    parser = argparse.ArgumentParser( description="Render glimmera frames offline, without a display." )
+    parser.add_argument( '--params', help="JSON parameter file, see --dump-params" )
+    parser.add_argument( '--texture', help="texture image to render with" )
+    parser.add_argument( '--timeline', help="replay a parameter timeline logged by the viewer" )
+    parser.add_argument( '--frames', help="frame range start:end (end exclusive), or one frame, "
+                                          "default 0:100 or the timeline's frames" )
+    parser.add_argument( '--shard', default='1/1', help="render only shard i/n of the frame range (1 based)" )
+    parser.add_argument( '--processes', type=int, help="worker processes, 0 for one per core, "
+                                                       "default 1, or one per core with --split" )
+    parser.add_argument( '--size', help="output WIDTHxHEIGHT, default %dx%d or the timeline's window size"
+                                        % ( glimmera.width, glimmera.height ) )
+    parser.add_argument( '--samples', type=int, help="override the shutter sample count" )
+    parser.add_argument( '--sink', default='png', choices=sorted( glimmera.frameSinks ) )
+    parser.add_argument( '--depth', default='8', choices=sorted( glimmera.pixelDepths ),
+                         help="bits per sample, or float for linear float32 frames" )
+    parser.add_argument( '--output', help="sink output, a directory for png, '-' for stdout streams" )
+    parser.add_argument( '--accumulate', action='store_true',
+                         help="reuse shutter segments between consecutive frames, an approximation "
+                              "that only matches the normal render with offset_wave_amps at zero" )
+    parser.add_argument( '--tile', type=int, help="render and write frames in tiles of this many pixels square, "
+                                                  "png sink only" )
+    parser.add_argument( '--gl', action='store_true', help="render tiles with OpenGL, in one process" )
+    parser.add_argument( '--sheet', help="render contact sheets of the textures in this directory or glob" )
+    parser.add_argument( '--variants', nargs='+', metavar='PARAMS',
+                         help="render contact sheets of these parameter files, with --texture" )
+    parser.add_argument( '--split', action='store_true',
+                         help="split each frame's shutter samples over the processes, for stills" )
+    parser.add_argument( '--no-cache', action='store_true',
+                         help="render every frame again rather than reusing the frame cache" )
+    parser.add_argument( '--cache-dir', default=glimmera.frameCacheDir, help="frame cache directory" )
+    parser.add_argument( '--dump-params', action='store_true', help="print the parameters as JSON and exit" )
+    args = parser.parse_args()
+
+    if args.timeline and args.params :
+        parser.error( "--params and --timeline cannot be used together" )
+    try :
+        parameters = loadParameters( args.params )
+        timeline = glimmera.Timeline( args.timeline ) if args.timeline else None
+        if args.frames :
+            frames = parseFrameRange( args.frames )
+        else :
+            frames = timeline.getFrames() if timeline else parseFrameRange( '0:100' )
+        frames = getShardFrames( frames, args.shard )
+    except ValueError as e :
+        parser.error( str( e ) )
+    if args.dump_params :
+        print( json.dumps( parameters, indent=4, sort_keys=True ) )
+        return
+    if ( args.sheet or args.variants ) and ( timeline or args.tile or args.accumulate ) :
+        parser.error( "--sheet and --variants cannot be used with --timeline, --tile or --accumulate" )
+    if args.split and ( args.sheet or args.variants or args.tile or args.accumulate ) :
+        parser.error( "--split cannot be used with --sheet, --variants, --tile or --accumulate" )
+    if not args.texture and not timeline and not args.sheet :
+        parser.error( "--texture, --timeline or --sheet is required" )
+    if args.depth not in glimmera.frameSinks[ args.sink ].depths :
+        parser.error( "the %s sink takes --depth %s" % ( args.sink, " or ".join( glimmera.frameSinks[ args.sink ].depths ) ) )
+    if args.gl and not args.tile :
+        parser.error( "--gl needs --tile" )
+    if args.gl and glimmera.openGLError is not None :
+        parser.error( "--gl needs OpenGL, which could not be loaded: %s" % glimmera.openGLError )
+    if args.tile and ( args.sink != 'png' or args.accumulate ) :
+        parser.error( "--tile only works with the png sink and without --accumulate" )
+
+    if args.size :
+        size = parseSize( args.size )
+    else :
+        size = tuple( timeline.frame_size ) if timeline else ( glimmera.width, glimmera.height )
+    if args.gl :
+        processes = 1
+    elif args.processes is None and not args.split :
+        processes = 1
+    else :
+        processes = args.processes or multiprocessing.cpu_count()
+    if args.split and processes < 2 :
+        parser.error( "--split needs --processes 2 or more, not %d" % processes )
+    tasks = getFrameTasks( frames, args.texture, parameters, timeline, args.samples )
+    try :
+        sheet = getSheetCells( args.sheet, args.variants, args.texture, parameters, args.samples )
+    except ValueError as e :
+        parser.error( str( e ) )
+    # tiled frames never pass through here, and sheets have no single texture to key
+    useCache = not ( args.no_cache or args.tile or sheet )
+    cache = glimmera.FrameCache( args.cache_dir ) if useCache else None
+    sink = glimmera.makeFrameSink( args.sink, args.output, min( frames, default=0 ) )
+    renderFrames( tasks, sink, size, processes, args.depth, args.accumulate, args.tile, args.output, args.gl, sheet,
+                  args.split, cache )
+
+if __name__ == '__main__' :
+    main()
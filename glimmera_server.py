@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+
+# glimmera_server
+
+#    Copyright (c) 2006 Dan Wills.
+#
+#    'glimmera' is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 2.
+#
+#    'glimmera' is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with 'glimmera'; if not, write to the Free Software
+#    Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+"""
+__description__
+
+A long running local render service for glimmera, with a job queue.
+
+__info__
+
+Starting glimmera_render.py for every small job pays for the imports and for
+decoding its textures each time. The server stays up instead: jobs are
+posted to it as JSON over HTTP, queued and rendered one after another with
+the software renderer, and their progress polled. Decoded textures stay in a
+pool in the rendering processes between jobs, so a job reusing a texture
+starts rendering straight away.
+
+    python glimmera_server.py --port 8765 --processes 4
+
+    curl -X POST localhost:8765/jobs -d '{"texture": "textures/lump.jpg", "frames": "0:50", "output": "take1"}'
+    curl localhost:8765/jobs/1
+    curl -X DELETE localhost:8765/jobs/1
+
+A job takes the keys texture or timeline, frames ('start:end' or a frame,
+default 0:100 or the timeline's frames), parameters (any of
+glimmera.defaultParameters), size ('WIDTHxHEIGHT'), samples, sink, depth and
+output, as the glimmera_render.py options of the same names. GET /jobs lists
+the queued and running jobs and the last serverJobHistory finished ones,
+GET /status shows the queue and the texture pool.
+
+@author:    Dan Wills
+@copyright:    2008 Dan Wills
+@license:    GNU GPL version 2
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import http
+import json
+import os
+import time
+
+os.environ.setdefault( 'PYGAME_HIDE_SUPPORT_PROMPT', '1' )
+import glimmera
+import glimmera_render
+
+# decoded textures each rendering process keeps between jobs
+serverTexturePool = 16
+
+# finished jobs kept for GET /jobs, oldest dropped first
+serverJobHistory = 100
+
+# keys a job may have and the JSON types of their values, see the module docstring
+jobKeys = { 'texture' : str, 'timeline' : str, 'frames' : ( str, int ), 'parameters' : dict, 'size' : str,
+            'samples' : int, 'sink' : str, 'depth' : ( str, int ), 'output' : str }
+
+@functools.lru_cache( maxsize=serverTexturePool )
+def loadPoolTexture( texture_file, modified_time ) :
+    # keyed by modification time too, so an edited texture is loaded again
+    return glimmera.loadTextureImage( texture_file, mipmaps=True )
+
+def renderServerFrame( task, size, depth ) :
+    """
+    Renders a getFrameTasks task into pixels, in a rendering process.
+    """
+    frame_number, texture_file, parameters = task
+    texture = loadPoolTexture( texture_file, os.stat( texture_file ).st_mtime_ns )
+    image = glimmera.renderFrameSoftware( texture, frame_number, parameters, size[0], size[1] )
+    if depth != 'float' :
+        image = glimmera.toneMapImage( image, tone_map=parameters[ 'tone_map' ] )
+    return glimmera.imageToPixels( image, glimmera.pixelDepths[ depth ] )
+
+def getPoolStats() :
+    return loadPoolTexture.cache_info()._asdict()
+
+def getJsonTypeName( types ) :
+    jsonNames = { str : 'a string', int : 'an integer', dict : 'an object' }
+    return " or ".join( jsonNames[ t ] for t in ( types if isinstance( types, tuple ) else ( types, ) ) )
+
+class RenderJob( object ) :
+    """
+    A queued render, made from the JSON a client posted. Raises ValueError if
+    the job is not valid, before it is queued.
+    """
+
+    def __init__( self, job_id, spec ) :
+        unknown = set( spec ) - set( jobKeys )
+        if unknown :
+            raise ValueError( "unknown job keys: %s" % ", ".join( sorted( unknown ) ) )
+        for key, value in spec.items() :
+            # null is taken as leaving the key out
+            if value is not None and ( isinstance( value, bool ) or not isinstance( value, jobKeys[ key ] ) ) :
+                raise ValueError( "job key %s is %s, not %s" % ( key, json.dumps( value ), getJsonTypeName( jobKeys[ key ] ) ) )
+        if spec.get( 'samples' ) is not None and spec[ 'samples' ] < 1 :
+            raise ValueError( "a job needs at least 1 sample" )
+        if not spec.get( 'texture' ) and not spec.get( 'timeline' ) :
+            raise ValueError( "a job needs a texture or a timeline" )
+        if spec.get( 'texture' ) and not os.path.isfile( spec[ 'texture' ] ) :
+            raise ValueError( "no texture %s" % spec[ 'texture' ] )
+
+        self.job_id = job_id
+        self.spec = spec
+        timeline = glimmera.Timeline( spec[ 'timeline' ] ) if spec.get( 'timeline' ) else None
+        parameters = glimmera_render.updateParameters( glimmera.defaultParameters, spec.get( 'parameters' ) or {},
+                                                       "job %s" % job_id )
+        if spec.get( 'frames' ) is not None :
+            frames = glimmera_render.parseFrameRange( str( spec[ 'frames' ] ) )
+        else :
+            frames = timeline.getFrames() if timeline else glimmera_render.parseFrameRange( '0:100' )
+        self.tasks = glimmera_render.getFrameTasks( frames, spec.get( 'texture' ), parameters, timeline,
+                                                    spec.get( 'samples' ) )
+
+        if spec.get( 'size' ) :
+            self.size = glimmera_render.parseSize( spec[ 'size' ] )
+        else :
+            self.size = tuple( timeline.frame_size ) if timeline else ( glimmera.width, glimmera.height )
+        self.sink_type = spec.get( 'sink' ) or 'png'
+        self.depth = str( spec.get( 'depth' ) or '8' )
+        self.output = spec.get( 'output' )
+        if self.sink_type not in glimmera.frameSinks :
+            raise ValueError( "unknown sink %s" % self.sink_type )
+        if self.depth not in glimmera.frameSinks[ self.sink_type ].depths :
+            raise ValueError( "the %s sink takes depth %s" % ( self.sink_type,
+                                                              " or ".join( glimmera.frameSinks[ self.sink_type ].depths ) ) )
+        if self.output == '-' :
+            raise ValueError( "server jobs cannot write to stdout" )
+
+        self.frame_count = len( self.tasks )
+        self.state = 'queued'
+        self.frames_done = 0
+        self.error = None
+        self.cancelled = False
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def getStatus( self ) :
+        return { 'id' : self.job_id, 'state' : self.state, 'frames' : self.frame_count,
+                 'frames_done' : self.frames_done, 'error' : self.error, 'submitted' : self.submitted,
+                 'started' : self.started, 'finished' : self.finished, 'spec' : self.spec }
+
+class RenderServer( object ) :
+    """
+    Takes jobs over HTTP and renders them in order, processes frames at a
+    time, on one executor kept for the life of the server.
+    """
+
+    def __init__( self, processes=1, job_history=serverJobHistory ) :
+        self.processes = processes
+        self.job_history = job_history
+        if processes > 1 :
+            self.executor = concurrent.futures.ProcessPoolExecutor( processes )
+        else :
+            self.executor = concurrent.futures.ThreadPoolExecutor( 1 )
+        # job id -> RenderJob, oldest first
+        self.jobs = collections.OrderedDict()
+        self.queue = asyncio.Queue()
+        self.next_id = 1
+
+    def submit( self, spec ) :
+        if not isinstance( spec, dict ) :
+            raise ValueError( "a job is a JSON object" )
+        job = RenderJob( str( self.next_id ), spec )
+        self.next_id += 1
+        self.jobs[ job.job_id ] = job
+        self.queue.put_nowait( job )
+        return job
+
+    async def runJobs( self ) :
+        while True :
+            job = await self.queue.get()
+            if not job.cancelled :
+                await self.runJob( job )
+            self.finishJob( job )
+    
+    def finishJob( self, job ) :
+        """
+        Lets go of a finished job's frames, and of the oldest finished jobs
+        past job_history, so a long running server does not keep growing.
+        """
+        job.tasks = None
+        if job.finished is None :
+            job.finished = time.time()
+        finished = [ jobId for jobId, oldJob in self.jobs.items() if oldJob.tasks is None ]
+        for jobId in finished[ :max( 0, len( finished ) - self.job_history ) ] :
+            del self.jobs[ jobId ]
+
+    async def runJob( self, job ) :
+        loop = asyncio.get_running_loop()
+        job.state = 'running'
+        job.started = time.time()
+        sink = None
+        # frames are rendered processes at a time but written in order, for the stream sinks
+        pending = collections.deque()
+        try :
+            firstFrame = min( ( task[0] for task in job.tasks ), default=0 )
+            sink = glimmera.makeFrameSink( job.sink_type, job.output, firstFrame )
+            for task in job.tasks :
+                if job.cancelled :
+                    break
+                pending.append( ( task[0], loop.run_in_executor( self.executor, renderServerFrame,
+                                                                 task, job.size, job.depth ) ) )
+                if len( pending ) >= self.processes :
+                    await self.writeFrame( job, sink, *pending.popleft() )
+            while pending and not job.cancelled :
+                await self.writeFrame( job, sink, *pending.popleft() )
+            job.state = 'cancelled' if job.cancelled else 'done'
+        except Exception as e :
+            job.state = 'failed'
+            job.error = "%s: %s" % ( type( e ).__name__, e )
+        finally :
+            for frameNumber, future in pending :
+                future.cancel()
+            if sink is not None :
+                sink.close()
+            job.finished = time.time()
+
+    async def writeFrame( self, job, sink, frame_number, future ) :
+        pixels = await future
+        await asyncio.get_running_loop().run_in_executor( None, sink.write, pixels, frame_number )
+        job.frames_done += 1
+
+    def route( self, method, path, body ) :
+        """
+        Returns the HTTP status and JSON response for a request.
+        """
+        parts = [ part for part in path.split( '?' )[0].split( '/' ) if part ]
+        if parts == [ 'status' ] and method == 'GET' :
+            # each rendering process has its own pool, only this one's can be seen
+            return 200, { 'queued' : self.queue.qsize(), 'jobs' : len( self.jobs ),
+                          'processes' : self.processes,
+                          'texture_pool' : getPoolStats() if self.processes == 1 else None }
+        if parts == [ 'jobs' ] and method == 'GET' :
+            return 200, [ job.getStatus() for job in self.jobs.values() ]
+        if parts == [ 'jobs' ] and method == 'POST' :
+            return 202, self.submit( json.loads( body or b'null' ) ).getStatus()
+        if len( parts ) == 2 and parts[0] == 'jobs' :
+            job = self.jobs.get( parts[1] )
+            if job is None :
+                return 404, { 'error' : "no job %s" % parts[1] }
+            if method == 'GET' :
+                return 200, job.getStatus()
+            if method == 'DELETE' :
+                if job.state in ( 'queued', 'running' ) :
+                    job.cancelled = True
+                    if job.state == 'queued' :
+                        job.state = 'cancelled'
+                return 200, job.getStatus()
+        return 404, { 'error' : "no %s %s" % ( method, path ) }
+
+    async def handleConnection( self, reader, writer ) :
+        try :
+            requestLine = await reader.readline()
+            method, path, version = requestLine.decode( 'latin-1' ).split()
+            headers = {}
+            while True :
+                line = await reader.readline()
+                if line in ( b'\r\n', b'\n', b'' ) :
+                    break
+                name, separator, value = line.decode( 'latin-1' ).partition( ':' )
+                headers[ name.strip().lower() ] = value.strip()
+            body = await reader.readexactly( int( headers.get( 'content-length', 0 ) ) )
+            status, response = self.route( method, path, body )
+        except ( ValueError, OSError, asyncio.IncompleteReadError ) as e :
+            status, response = 400, { 'error' : str( e ) }
+        except Exception as e :
+            # still answer, rather than dropping the connection
+            status, response = 500, { 'error' : "%s: %s" % ( type( e ).__name__, e ) }
+
+        payload = json.dumps( response, indent=4 ).encode( 'utf-8' ) + b'\n'
+        writer.write( ( "HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n"
+                        "Connection: close\r\n\r\n" % ( status, http.HTTPStatus( status ).phrase,
+                                                        len( payload ) ) ).encode( 'latin-1' ) + payload )
+        try :
+            await writer.drain()
+        finally :
+            writer.close()
+
+    async def serve( self, host, port ) :
+        server = await asyncio.start_server( self.handleConnection, host, port )
+        print( "glimmera server on http://%s:%d/ with %d render processes" % ( host, port, self.processes ) )
+        jobRunner = asyncio.ensure_future( self.runJobs() )
+        try :
+            async with server :
+                await server.serve_forever()
+        finally :
+            jobRunner.cancel()
+            self.executor.shutdown( wait=False, cancel_futures=True )
+
+def main() :
+    parser = argparse.ArgumentParser( description="Serve glimmera render jobs over local HTTP." )
+    parser.add_argument( '--host', default='127.0.0.1', help="address to listen on, local only by default" )
+    parser.add_argument( '--port', type=int, default=8765 )
+    parser.add_argument( '--processes', type=int, default=1, help="render processes, 0 for one per core" )
+    args = parser.parse_args()
+
+    server = RenderServer( args.processes or os.cpu_count() or 1 )
+    try :
+        asyncio.run( server.serve( args.host, args.port ) )
+    except KeyboardInterrupt :
+        pass
+
+if __name__ == '__main__' :
+    main()
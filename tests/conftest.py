@@ -0,0 +1,9 @@
+import os
+import sys
+
+# the glimmera scripts are run from the repository root, not installed
+repositoryDir = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+sys.path.insert( 0, repositoryDir )
+os.environ.setdefault( 'PYGAME_HIDE_SUPPORT_PROMPT', '1' )
+
+textureFile = os.path.join( repositoryDir, 'textures', 'lump.jpg' )
@@ -0,0 +1,21 @@
+import numpy as np
+
+import glimmera
+from conftest import textureFile
+
+def getPixels( image ) :
+    return glimmera.imageToPixels( glimmera.toneMapImage( image ), glimmera.pixelDepths[ '8' ] ).astype( np.int32 )
+
+def test_accumulate_matches_normal_render_without_the_offset_wave() :
+    texture = glimmera.loadTextureImage( textureFile, mipmaps=True )
+    parameters = dict( glimmera.defaultParameters, shutter_samples=64, exposure=30.0, offset_wave_amps=[ 0.0, 0.0 ] )
+    accumulator = glimmera.SubframeAccumulator( glimmera.SoftwareSubframes( 64, 48 ) )
+    for frameNumber in range( 0, 6 ) :
+        accumulated = getPixels( glimmera.renderFrameAccumulated( accumulator, texture, frameNumber, parameters ) )
+        expected = getPixels( glimmera.renderFrameSoftware( texture, frameNumber, parameters, 64, 48 ) )
+        difference = np.abs( accumulated - expected )[ ..., :3 ]
+        assert expected[ ..., :3 ].mean() > 1.0
+        assert difference.mean() < 0.5
+        assert difference.max() <= 8
+    # later frames reused the segments drawn for earlier ones
+    assert accumulator.drawn_samples < 6 * parameters[ 'shutter_samples' ]
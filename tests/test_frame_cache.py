@@ -0,0 +1,63 @@
+import numpy as np
+
+import glimmera
+import glimmera_render
+from conftest import textureFile
+
+def renderCached( cache, frames, output, processes=1, split=False ) :
+    tasks = glimmera_render.getFrameTasks( frames, textureFile, glimmera.defaultParameters, samples=8 )
+    glimmera_render.renderFrames( tasks, glimmera.MemmapSink( output ), ( 32, 24 ), processes, split=split,
+                                  cache=cache )
+    return np.load( output )
+
+def test_hit_and_miss( tmp_path ) :
+    cache = glimmera.FrameCache( str( tmp_path / 'cache' ) )
+    key = cache.getKey( 3, textureFile, glimmera.defaultParameters, 32, 24 )
+    assert not cache.touch( key )
+    assert cache.get( key ) is None
+    
+    pixels = np.arange( 32 * 24 * 4, dtype=np.uint8 ).reshape( 24, 32, 4 )
+    cache.put( key, pixels )
+    assert cache.touch( key )
+    assert np.array_equal( cache.get( key ), pixels )
+    assert cache.hits == 1
+    
+    otherKey = cache.getKey( 3, textureFile, dict( glimmera.defaultParameters, shutter_samples=9 ), 32, 24 )
+    assert otherKey != key
+    assert cache.get( otherKey ) is None
+
+def test_corrupt_entry_is_a_miss_and_deleted( tmp_path ) :
+    cache = glimmera.FrameCache( str( tmp_path / 'cache' ) )
+    pixels = np.zeros( ( 24, 32, 4 ), np.uint8 )
+    for frameNumber, contents in enumerate( ( b'', b'\x93NUMPY' ) ) :
+        key = cache.getKey( frameNumber, textureFile, glimmera.defaultParameters, 32, 24 )
+        cache.put( key, pixels )
+        with open( cache.getFilename( key ), 'wb' ) as cacheFile :
+            cacheFile.write( contents )
+        assert cache.get( key ) is None
+        assert not cache.touch( key )
+    assert cache.hits == 0
+
+def test_unreadable_entry_is_rendered_again( tmp_path, monkeypatch ) :
+    cache = glimmera.FrameCache( str( tmp_path / 'cache' ) )
+    expected = renderCached( cache, range( 0, 3 ), str( tmp_path / 'first.npy' ) )
+    
+    # frame 0 is still there when touched, but cut short when read, and
+    # frame 3 sends the rest to the split renderer, with no worker set up here
+    key = cache.getKey( 0, textureFile, dict( glimmera.defaultParameters, shutter_samples=8 ), 32, 24 )
+    with open( cache.getFilename( key ), 'r+b' ) as cacheFile :
+        cacheFile.truncate( 64 )
+    monkeypatch.setattr( glimmera_render, 'workerSize', None )
+    frames = renderCached( cache, range( 0, 4 ), str( tmp_path / 'second.npy' ), processes=2, split=True )
+    
+    assert np.array_equal( frames[ :3 ], expected )
+    assert cache.hits == 2
+
+def test_failed_put_leaves_no_temp_file( tmp_path, monkeypatch ) :
+    cache = glimmera.FrameCache( str( tmp_path / 'cache' ) )
+    def failSave( npy_file, data ) :
+        raise OSError( "no space left on device" )
+    monkeypatch.setattr( glimmera.np, 'save', failSave )
+    cache.put( cache.getKey( 0, textureFile, glimmera.defaultParameters, 32, 24 ), np.zeros( ( 24, 32, 4 ), np.uint8 ) )
+    assert list( ( tmp_path / 'cache' ).iterdir() ) == []
+    assert cache.total_bytes == 0
@@ -0,0 +1,16 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from conftest import repositoryDir, textureFile
+
+def test_software_render_without_a_gl_library( tmp_path ) :
+    # a GL platform with no library here, as on a box without a GPU or X
+    environment = dict( os.environ, PYOPENGL_PLATFORM='osmesa' )
+    output = str( tmp_path / 'frames.npy' )
+    subprocess.run( [ sys.executable, os.path.join( repositoryDir, 'glimmera_render.py' ), '--texture', textureFile,
+                      '--frames', '0:2', '--size', '32x24', '--samples', '8', '--no-cache', '--sink', 'memmap',
+                      '--output', output ], env=environment, check=True, capture_output=True )
+    assert np.load( output ).shape == ( 2, 24, 32, 4 )
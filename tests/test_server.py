@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import pytest
+
+import glimmera_server
+from conftest import textureFile
+
+@pytest.mark.parametrize( 'spec', [
+    { 'texture' : textureFile, 'parameters' : 5 },
+    { 'texture' : textureFile, 'size' : 64 },
+    { 'texture' : textureFile, 'size' : '64' },
+    { 'texture' : textureFile, 'samples' : '8' },
+    { 'texture' : textureFile, 'samples' : 0 },
+    { 'texture' : textureFile, 'output' : [ 'take1' ] },
+    { 'texture' : 3 },
+    { 'texture' : textureFile, 'parameters' : { 'shutter_samples' : 'x' } },
+    { 'texture' : textureFile, 'parameters' : { 'offset' : [ 1.0 ] } },
+    { 'texture' : textureFile, 'parameters' : { 'tone_map' : 'sideways' } },
+    { 'texture' : textureFile, 'parameters' : { 'colour' : 1 } },
+    { 'texture' : textureFile, 'sink' : 'raw', 'output' : '-' },
+    { 'frames' : '0:10' },
+] )
+def test_invalid_jobs_are_refused( spec ) :
+    with pytest.raises( ValueError ) :
+        glimmera_server.RenderJob( '1', spec )
+
+def test_valid_job( tmp_path ) :
+    job = glimmera_server.RenderJob( '1', { 'texture' : textureFile, 'frames' : 4, 'size' : '32x24', 'samples' : 8,
+                                            'parameters' : { 'exposure' : 2, 'offset' : [ 0, 1 ] },
+                                            'depth' : 16, 'output' : str( tmp_path ) } )
+    assert job.size == ( 32, 24 )
+    assert job.depth == '16'
+    assert [ task[0] for task in job.tasks ] == [ 4 ]
+    assert job.tasks[0][2][ 'shutter_samples' ] == 8
+
+def postJob( server, body ) :
+    async def post() :
+        listener = await asyncio.start_server( server.handleConnection, '127.0.0.1', 0 )
+        async with listener :
+            port = listener.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection( '127.0.0.1', port )
+            writer.write( b"POST /jobs HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % ( len( body ), body ) )
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        statusLine, separator, payload = response.partition( b'\r\n\r\n' )
+        return int( statusLine.split()[1] ), json.loads( payload )
+    return asyncio.run( post() )
+
+def test_bad_job_gets_a_reply() :
+    server = glimmera_server.RenderServer()
+    status, response = postJob( server, b'{"size": 64}' )
+    assert status == 400
+    assert 'size' in response[ 'error' ]
+    
+    def fail( spec ) :
+        raise TypeError( "broken" )
+    server.submit = fail
+    status, response = postJob( server, b'{}' )
+    assert status == 500
+    assert response[ 'error' ] == "TypeError: broken"
+
+def test_finished_jobs_are_bounded( tmp_path ) :
+    async def runJobs() :
+        server = glimmera_server.RenderServer( job_history=2 )
+        jobs = [ server.submit( { 'texture' : textureFile, 'frames' : '0:2', 'size' : '16x16', 'samples' : 4,
+                                  'output' : str( tmp_path / str( i ) ) } ) for i in range( 4 ) ]
+        runner = asyncio.ensure_future( server.runJobs() )
+        while server.queue.qsize() or jobs[ -1 ].finished is None :
+            await asyncio.sleep( 0.01 )
+        runner.cancel()
+        server.executor.shutdown()
+        return server, jobs
+    server, jobs = asyncio.run( runJobs() )
+    assert [ job.state for job in jobs ] == [ 'done' ] * 4
+    assert list( server.jobs ) == [ jobs[2].job_id, jobs[3].job_id ]
+    assert all( job.tasks is None for job in jobs )
+    assert jobs[3].getStatus()[ 'frames' ] == 2
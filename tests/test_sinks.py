@@ -0,0 +1,26 @@
+import io
+import sys
+
+import numpy as np
+
+import glimmera
+
+def test_raw_sink_gives_stdout_back( monkeypatch ) :
+    stdout = io.TextIOWrapper( io.BytesIO() )
+    monkeypatch.setattr( sys, 'stdout', stdout )
+    sink = glimmera.RawSink( '-' )
+    print( "progress" )
+    sink.write( np.arange( 2 * 3 * 4, dtype=np.uint8 ).reshape( 2, 3, 4 ), 0 )
+    sink.close()
+    assert sys.stdout is stdout
+    assert stdout.buffer.getvalue() == np.arange( 24, dtype=np.uint8 ).reshape( 2, 3, 4 )[ ::-1 ].tobytes()
+
+def test_memmap_sink_starts_at_its_first_frame( tmp_path ) :
+    output = str( tmp_path / 'frames.npy' )
+    sink = glimmera.makeFrameSink( 'memmap', output, first_frame=2000 )
+    for frameNumber in ( 2001, 2000 ) :
+        sink.write( np.full( ( 2, 3, 4 ), frameNumber % 256, np.uint8 ), frameNumber )
+    sink.close()
+    frames = np.load( output )
+    assert frames.shape == ( 2, 2, 3, 4 )
+    assert list( frames[ :, 0, 0, 0 ] ) == [ 2000 % 256, 2001 % 256 ]
@@ -0,0 +1,14 @@
+import numpy as np
+
+import glimmera
+import glimmera_render
+from conftest import textureFile
+
+def test_split_matches_software_renderer( tmp_path ) :
+    tasks = glimmera_render.getFrameTasks( range( 0, 3 ), textureFile, glimmera.defaultParameters, samples=24 )
+    outputs = []
+    for name, processes, split in ( ( 'software', 1, False ), ( 'split', 2, True ) ) :
+        output = str( tmp_path / ( name + '.npy' ) )
+        glimmera_render.renderFrames( tasks, glimmera.MemmapSink( output ), ( 48, 32 ), processes, split=split )
+        outputs.append( np.load( output ) )
+    assert outputs[0].tobytes() == outputs[1].tobytes()
@@ -0,0 +1,87 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import glimmera
+from conftest import repositoryDir, textureFile
+
+otherTextureFile = os.path.join( repositoryDir, 'textures', 'indrasBall.jpg' )
+
+@pytest.fixture
+def cacheDir( tmp_path, monkeypatch ) :
+    monkeypatch.setattr( glimmera, 'textureCacheDir', str( tmp_path / 'textures' ) )
+    return tmp_path / 'textures'
+
+def test_cached_texture_matches_decoded( cacheDir ) :
+    decoded = glimmera.loadTextureData( textureFile )
+    cached = glimmera.loadTextureData( textureFile )
+    assert isinstance( cached, np.memmap )
+    assert np.array_equal( cached, decoded )
+
+def test_least_recently_used_texture_is_pruned( cacheDir, monkeypatch ) :
+    glimmera.loadTextureData( textureFile )
+    firstFilename = glimmera.getTextureCacheFilename( textureFile )
+    # room for the second texture's pixels, but not for both files
+    otherBytes = glimmera.decodeTexture( otherTextureFile ).nbytes
+    monkeypatch.setattr( glimmera, 'textureCacheBytes', os.path.getsize( firstFilename ) + otherBytes )
+    os.utime( firstFilename, ( 0, 0 ) )
+    glimmera.loadTextureData( otherTextureFile )
+    assert not os.path.exists( firstFilename )
+    assert os.path.exists( glimmera.getTextureCacheFilename( otherTextureFile ) )
+
+def test_failed_write_leaves_no_temp_file( cacheDir, monkeypatch ) :
+    def failSave( npy_file, data ) :
+        raise OSError( "no space left on device" )
+    monkeypatch.setattr( glimmera.np, 'save', failSave )
+    assert glimmera.loadTextureData( textureFile ).shape[ 2 ] == 4
+    assert os.listdir( str( cacheDir ) ) == []
+
+def test_warming_does_not_hold_up_selection( cacheDir, tmp_path, monkeypatch ) :
+    textureFiles = []
+    for i in range( 40 ) :
+        textureFiles.append( str( tmp_path / ( 'texture%d.jpg' % i ) ) )
+        open( textureFiles[ -1 ], 'wb' ).close()
+    def slowLoad( texture_file ) :
+        time.sleep( 0.05 )
+        return np.zeros( ( 4, 4, 4 ), np.uint8 )
+    monkeypatch.setattr( glimmera, 'loadTextureData', slowLoad )
+    
+    textures = glimmera.TextureManager( textureFiles, workers=1 )
+    def upload( index, texture_data ) :
+        textures.resident[ index ] = ( index, texture_data.nbytes )
+    monkeypatch.setattr( textures, 'upload', upload )
+    try :
+        # each step right finds its prefetch queued or running, not behind the warming
+        for index in range( 4 ) :
+            startTime = time.time()
+            assert textures.get( index ) == index
+            assert time.time() - startTime < 0.5
+        assert textures.getStats()[ 'warming' ] > 0
+    finally :
+        textures.close()
+
+def test_unreadable_neighbour_is_not_retried( cacheDir, tmp_path, monkeypatch ) :
+    textureFiles = [ str( tmp_path / ( 'texture%d.jpg' % i ) ) for i in range( 3 ) ]
+    loads = []
+    def load( texture_file ) :
+        loads.append( texture_file )
+        if texture_file == textureFiles[ 1 ] :
+            raise OSError( "unreadable" )
+        return np.zeros( ( 4, 4, 4 ), np.uint8 )
+    monkeypatch.setattr( glimmera, 'loadTextureData', load )
+    monkeypatch.setattr( glimmera, 'textureCacheDir', None )
+    
+    textures = glimmera.TextureManager( textureFiles, workers=1 )
+    def upload( index, texture_data ) :
+        textures.resident[ index ] = ( index, texture_data.nbytes )
+    monkeypatch.setattr( textures, 'upload', upload )
+    try :
+        for frame in range( 20 ) :
+            textures.get( 0 )
+            time.sleep( 0.01 )
+        assert loads.count( textureFiles[ 1 ] ) == 1
+        assert textures.getStats()[ 'failed' ] == 1
+    finally :
+        textures.close()